@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from extraction import PDF_MIME, DOCX_MIME, TXT_MIME, iter_pages, iter_chunks
+from rag import index_key, embed_chunks, MODEL_ID, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+from corpus import Corpus
+from ingest import ingest_files
+from summarizer import (
+    map_reduce_summarize, select_representative, summarize_selected, format_level_stats,
+    SUMMARY_CHUNK_TOKENS, SUMMARY_MODE
+)
+from metrics import trace
+
+# Headless counterpart of doc_summarizer_finder.py: indexes and summarizes every document under a folder
+FILE_TYPES = {".pdf": PDF_MIME, ".docx": DOCX_MIME, ".txt": TXT_MIME}
+MANIFEST_NAME = "manifest.json"
+# Files indexed with a different model or chunking are processed again
+INDEX_PARAMS = f"{MODEL_ID}:{CHUNK_TOKENS}:{CHUNK_OVERLAP_TOKENS}"
+
+
+class Manifest:
+    # Per-file checkpoint: {relative path: {"sha256", "doc_id", "status", ...}}, rewritten atomically after each change
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get(self, name):
+        with self.lock:
+            return dict(self.entries.get(name, {}))
+
+    def update(self, name, **fields):
+        with self.lock:
+            self.entries.setdefault(name, {}).update(fields, updated=time.time())
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+def walk(input_dir):
+    for root, dirs, names in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(names):
+            file_type = FILE_TYPES.get(os.path.splitext(name)[1].lower())
+            if file_type:
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, input_dir), path, file_type
+
+
+def summary_path(output_dir, name):
+    return os.path.join(output_dir, "summaries", name + ".md")
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def summarize_document(client, corpus, item, model):
+    if SUMMARY_MODE == "extractive":
+        records = corpus.document_chunks(item["doc_id"])
+        selected = [records[i]["text"] for i in select_representative(embed_chunks([r["text"] for r in records]))]
+        return summarize_selected(client, selected, model=model)
+    with open(item["path"], "rb") as f:
+        chunks = list(iter_chunks(iter_pages(f.read(), item["type"]), SUMMARY_CHUNK_TOKENS, 0))
+    return map_reduce_summarize(client, chunks, model=model)
+
+
+def write_summary(output_dir, name, summary, levels):
+    path = summary_path(output_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(f"# {name}\n\n{summary}\n")
+        if levels:
+            f.write("\n" + "\n".join(f"<!-- {line} -->" for line in format_level_stats(levels)) + "\n")
+    os.replace(tmp_path, path)
+    return path
+
+
+def plan(input_dir, manifest, summarize, force):
+    # Returns files that still need indexing and/or summarizing; unchanged, finished files are skipped by hash
+    todo, skipped = [], 0
+    done = ("summarized", "empty") if summarize else ("indexed", "summarized", "empty")
+    for name, path, file_type in walk(input_dir):
+        digest = file_digest(path)
+        entry = manifest.get(name)
+        unchanged = entry.get("sha256") == digest and entry.get("index_params") == INDEX_PARAMS
+        if not force and unchanged and entry.get("status") in done:
+            skipped += 1
+            continue
+        todo.append({"name": name, "path": path, "type": file_type, "sha256": digest})
+    return todo, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index and summarize every PDF, DOCX and TXT file under a folder")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir", help="holds the corpus index, summaries/ and the manifest")
+    parser.add_argument("--workers", type=int, default=4, help="documents summarized concurrently")
+    parser.add_argument("--batch-files", type=int, default=32, help="files read, parsed and embedded per batch")
+    parser.add_argument("--no-summary", action="store_true", help="only build the search index")
+    parser.add_argument("--force", action="store_true", help="reprocess files even if unchanged")
+    parser.add_argument("--model", default="gpt-4-0613")
+    parser.add_argument("--stub-llm", action="store_true", help="use the offline stub instead of the OpenAI API")
+    parser.add_argument("--stub-latency", type=float, default=0.0)
+    parser.add_argument("--offline", action="store_true",
+                        help="never contact the Hugging Face hub; models must be cached or in RAG_MODEL_PATH")
+    args = parser.parse_args()
+    if args.offline:
+        # Read by extraction, sentence-transformers and the ingest workers, which inherit the environment
+        os.environ["HF_HUB_OFFLINE"] = "1"
+
+    load_dotenv()
+    if args.stub_llm:
+        from stub_llm import StubChatClient
+        client = StubChatClient(latency=args.stub_latency)
+    else:
+        from openai import OpenAI
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(args.output_dir, MANIFEST_NAME))
+    corpus = Corpus(directory=os.path.join(args.output_dir, "corpus"))
+    summarize = not args.no_summary
+
+    started = time.perf_counter()
+    todo, skipped = plan(args.input_dir, manifest, summarize, args.force)
+    print(f"{len(todo)} file(s) to process, {skipped} unchanged file(s) skipped")
+
+    counts = {"indexed": 0, "summarized": 0, "empty": 0, "failed": 0}
+    summary_pool = ThreadPoolExecutor(max_workers=max(1, args.workers))
+    pending = {}
+
+    def finish_summary(future):
+        name = pending.pop(future)
+        try:
+            path = future.result()
+            manifest.update(name, status="summarized", summary=os.path.relpath(path, args.output_dir), error=None)
+            counts["summarized"] += 1
+        except Exception as e:
+            print(f"Summary failed for {name}: {e}")
+            manifest.update(name, status="indexed", error=f"summary: {e}")
+            counts["failed"] += 1
+
+    for i in range(0, len(todo), args.batch_files):
+        batch = todo[i:i + args.batch_files]
+        files = []
+        for item in batch:
+            with open(item["path"], "rb") as f:
+                data = f.read()
+            doc_id = index_key(data)
+            previous = manifest.get(item["name"]).get("doc_id")
+            if previous and previous != doc_id:
+                corpus.delete_document(previous)
+            item["doc_id"] = doc_id
+            files.append({"name": item["name"], "type": item["type"], "bytes": data, "doc_id": doc_id})
+
+        to_ingest = [f for f in files if not corpus.has_document(f["doc_id"])]
+        results = {}
+        if to_ingest:
+            with trace("batch_ingest", files=len(to_ingest)):
+                results = ingest_files(to_ingest, corpus=corpus)
+
+        for item in batch:
+            name, result = item["name"], results.get(item["name"])
+            if isinstance(result, Exception):
+                print(f"Could not index {name}: {result}")
+                manifest.update(name, sha256=item["sha256"], doc_id=item["doc_id"], status="failed", error=str(result))
+                counts["failed"] += 1
+                continue
+            if result == 0:
+                manifest.update(name, sha256=item["sha256"], doc_id=item["doc_id"], index_params=INDEX_PARAMS,
+                                status="empty", chunks=0, error=None)
+                counts["empty"] += 1
+                continue
+            chunks = result if result is not None else manifest.get(name).get("chunks")
+            manifest.update(name, sha256=item["sha256"], doc_id=item["doc_id"], index_params=INDEX_PARAMS,
+                            status="indexed", chunks=chunks, error=None)
+            counts["indexed"] += 1
+
+            if summarize:
+                def run(item=item):
+                    with trace("batch_summarize", file=item["name"]):
+                        summary, levels = summarize_document(client, corpus, item, args.model)
+                    # Failed calls come back as placeholder text; don't save that as a finished summary
+                    failed = sum(level["failed"] for level in levels)
+                    if failed:
+                        raise RuntimeError(f"{failed} LLM call(s) failed")
+                    return write_summary(args.output_dir, item["name"], summary, levels)
+                pending[summary_pool.submit(run)] = name
+
+        # Bounded backlog: indexing runs ahead of summarizing by at most a couple of rounds
+        while len(pending) > args.workers * 2:
+            finish_summary(next(as_completed(list(pending))))
+        print(f"[{min(i + args.batch_files, len(todo))}/{len(todo)}] {counts}")
+
+    for future in as_completed(list(pending)):
+        finish_summary(future)
+    summary_pool.shutdown()
+
+    seconds = time.perf_counter() - started
+    print(f"Done in {seconds:.1f}s: {counts}, {skipped} skipped")
+    if args.stub_llm:
+        print(f"Stub LLM calls: {client.calls}")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
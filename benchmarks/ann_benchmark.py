@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag import make_index, search_params
+
+
+def synthetic_embeddings(n, dim, queries, clusters=200, seed=0):
+    # Clustered unit vectors roughly resemble sentence embeddings better than uniform noise; the queries
+    # are held-out samples from the same clusters, as questions are about the indexed documents
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    total = n + queries
+    vectors = centers[rng.integers(0, clusters, size=total)] + 0.35 * rng.normal(size=(total, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors[:n], vectors[n:]
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f[f != -1]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def build(kind, data):
+    started = time.perf_counter()
+    index = make_index(data, kind=kind)
+    return index, time.perf_counter() - started
+
+
+def run(label, index, build_seconds, queries, truth, k, nprobe=None, ef_search=None):
+    params = search_params(index, nprobe, ef_search)
+    latencies, labels = [], []
+    for query in queries:
+        started = time.perf_counter()
+        _, found = index.search(query[None, :], k, params=params)
+        latencies.append((time.perf_counter() - started) * 1000)
+        labels.append(found[0])
+
+    latencies = np.array(latencies)
+    return {
+        "kind": label,
+        "build_s": round(build_seconds, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "recall": round(recall_at_k(np.array(labels), truth), 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs latency of ANN index modes against the flat baseline")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    args = parser.parse_args()
+
+    data, queries = synthetic_embeddings(args.vectors, args.dim, args.queries)
+
+    flat, flat_seconds = build("flat", data)
+    _, truth = flat.search(queries, args.k)
+
+    rows = [run("flat", flat, flat_seconds, queries, truth, args.k)]
+    for kind in ("ivf_flat", "ivf_pq"):
+        index, seconds = build(kind, data)
+        for nprobe in args.nprobe:
+            rows.append(run(f"{kind} nprobe={nprobe}", index, seconds, queries, truth, args.k, nprobe=nprobe))
+    index, seconds = build("hnsw", data)
+    for ef_search in args.ef_search:
+        rows.append(run(f"hnsw efSearch={ef_search}", index, seconds, queries, truth, args.k, ef_search=ef_search))
+
+    print(f"{'index':<24}{'build_s':>10}{'p50_ms':>10}{'p95_ms':>10}{'recall@' + str(args.k):>12}")
+    for row in rows:
+        print(f"{row['kind']:<24}{row['build_s']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['recall']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PHRASES = [
+    "yesterday", "today", "last night", "last friday", "last week", "last month",
+    "3 days ago", "two weeks ago", "a month ago", "2024-02-14", "12/25/2023",
+    "march 3rd", "the 5th of january", "about a week ago", "last tuesday evening"
+]
+
+
+def timed(fn, phrases, rounds):
+    samples = []
+    for _ in range(rounds):
+        for phrase in phrases:
+            started = time.perf_counter()
+            fn(phrase)
+            samples.append((time.perf_counter() - started) * 1000)
+    values = np.array(samples)
+    return {
+        "calls": len(samples),
+        "mean_ms": round(float(values.mean()), 4),
+        "p50_ms": round(float(np.percentile(values, 50)), 4),
+        "p99_ms": round(float(np.percentile(values, 99)), 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency of incident date resolution")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    # chatbot_engine builds an OpenAI client at import; no request is made here
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+    started = time.perf_counter()
+    import dateparser
+    print(f"import dateparser: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    started = time.perf_counter()
+    dateparser.parse("3 weeks ago")
+    print(f"first dateparser.parse (cold): {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    from chatbot_engine import parse_incident_date, _resolve_date
+
+    settings = {"PREFER_DATES_FROM": "past"}
+    print("dateparser.parse          ", timed(lambda p: dateparser.parse(p, settings=settings), PHRASES, args.rounds))
+
+    _resolve_date.cache_clear()
+    print("parse_incident_date (cold)", timed(parse_incident_date, PHRASES, 1))
+    print("parse_incident_date (warm)", timed(parse_incident_date, PHRASES, args.rounds))
+    print("cache", _resolve_date.cache_info())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import multiprocessing
+import resource
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+sys.path.insert(0, ROOT)
+
+FILLER = [
+    "The parties agree that the obligations set forth herein shall survive termination of this agreement.",
+    "Plaintiff alleges that Defendant failed to exercise reasonable care in maintaining the premises.",
+    "All notices required under this section shall be delivered in writing to the addresses listed below.",
+    "The court finds that the evidence presented does not support a claim for punitive damages.",
+    "Witness testified that the vehicle entered the intersection after the signal had turned red.",
+    "Counsel for the respondent objected to the admission of the exhibit on foundation grounds.",
+    "Any amendment to this agreement must be signed by authorized representatives of both parties.",
+    "The insurer denied coverage on the basis that the policy had lapsed prior to the date of loss."
+]
+
+
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {}
+    values = np.array(samples_ms)
+    return {f"p{p}_ms": round(float(np.percentile(values, p)), 3) for p in (50, 95, 99)}
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS; it never goes down within a process
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def synthetic_document(num_pages, seed=0, chars_per_page=2000):
+    rng = random.Random(seed)
+    pages, qa = [], []
+    for page_no in range(num_pages):
+        sentences = []
+        while sum(len(s) for s in sentences) < chars_per_page:
+            sentences.append(rng.choice(FILLER))
+        if page_no % 5 == 0:
+            docket = f"{rng.randint(10, 99)}-CV-{rng.randint(10000, 99999)}"
+            sentences.insert(rng.randint(0, len(sentences)), f"The docket number assigned to exhibit {page_no} is {docket}.")
+            qa.append({"question": f"What docket number was assigned to exhibit {page_no}?", "answer": docket})
+        paragraphs = [" ".join(sentences[i:i + 3]) for i in range(0, len(sentences), 3)]
+        pages.append("\n".join(paragraphs) + "\n")
+    return pages, qa
+
+
+def to_pdf(pages):
+    import fitz
+    doc = fitz.open()
+    for text in pages:
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(36, 36, 576, 756), text, fontsize=7)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def fixture_documents():
+    qa_by_file = {}
+    with open(os.path.join(FIXTURES, "qa.jsonl"), "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                qa_by_file.setdefault(item["file"], []).append(item)
+    for name, qa in sorted(qa_by_file.items()):
+        with open(os.path.join(FIXTURES, name), "rb") as f:
+            yield name, f.read(), qa
+
+
+def bench_document(name, file_bytes, file_type, qa, args, client, out_dir):
+    from rag import iter_pages, chunk_text, iter_chunk_records, embed_chunks, save_to_faiss, search_faiss
+    from corpus import Corpus
+    from summarizer import map_reduce_summarize, SUMMARY_CHUNK_TOKENS
+
+    result = {"document": name}
+
+    started = time.perf_counter()
+    pages = list(iter_pages(file_bytes, file_type))
+    seconds = time.perf_counter() - started
+    result["pages"] = len(pages)
+    result["extract_pages_per_s"] = round(len(pages) / seconds, 1) if seconds else None
+
+    text = "".join(pages)
+    started = time.perf_counter()
+    chunks = chunk_text(text)
+    seconds = time.perf_counter() - started
+    result["chunks"] = len(chunks)
+    result["chunk_chunks_per_s"] = round(len(chunks) / seconds, 1) if seconds else None
+
+    started = time.perf_counter()
+    embeddings = np.asarray(embed_chunks(chunks), dtype=np.float32)
+    seconds = time.perf_counter() - started
+    result["embed_cold_chunks_per_s"] = round(len(chunks) / seconds, 1)
+
+    started = time.perf_counter()
+    embed_chunks(chunks)
+    seconds = time.perf_counter() - started
+    result["embed_cached_chunks_per_s"] = round(len(chunks) / seconds, 1)
+
+    faiss_path = os.path.join(out_dir, os.path.splitext(name)[0])
+    started = time.perf_counter()
+    save_to_faiss(chunks, embeddings, faiss_path)
+    result["save_to_faiss_s"] = round(time.perf_counter() - started, 4)
+
+    latencies, hits = [], 0
+    for item in qa:
+        started = time.perf_counter()
+        top = search_faiss(item["question"], faiss_path, top_k=args.k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += any(item["answer"] in chunk for chunk in top)
+    result["search"] = percentiles(latencies)
+    result["search_queries_per_s"] = round(1000 * len(latencies) / sum(latencies), 1) if latencies else None
+    result[f"recall@{args.k}"] = round(hits / len(qa), 3) if qa else None
+
+    # Same chunks through the corpus: vector-only vs. BM25 + vector fusion
+    corpus = Corpus(directory=faiss_path + "_corpus")
+    corpus.add_document(name, name, list(iter_chunk_records([text])), embeddings)
+    for label, hybrid in (("vector", False), ("hybrid", True)):
+        latencies, hits = [], 0
+        for item in qa:
+            started = time.perf_counter()
+            top = corpus.search(item["question"], top_k=args.k, hybrid=hybrid)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += any(item["answer"] in record["text"] for record in top)
+        result[f"corpus_{label}_search"] = percentiles(latencies)
+        result[f"corpus_{label}_recall@{args.k}"] = round(hits / len(qa), 3) if qa else None
+
+    if not args.skip_llm:
+        client.calls = 0
+        started = time.perf_counter()
+        _, levels = map_reduce_summarize(client, chunk_text(text, chunk_tokens=SUMMARY_CHUNK_TOKENS, overlap_tokens=0))
+        result["summarize_s"] = round(time.perf_counter() - started, 3)
+        result["summarize_calls"] = client.calls
+        result["summarize_levels"] = levels
+
+        latencies = []
+        for item in qa:
+            started = time.perf_counter()
+            context = "\n\n".join(search_faiss(item["question"], faiss_path))
+            client.chat.completions.create(
+                model="gpt-4-0613",
+                messages=[{"role": "user", "content": f"Context:\n{context}\n\nQuestion:\n{item['question']}"}],
+                temperature=0.3
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+        result["find_answer"] = percentiles(latencies)
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def _bench_in_child(name, file_bytes, file_type, qa, args, out_dir):
+    from rag import get_model
+    from stub_llm import StubChatClient
+    # Loaded before any timing so model start-up is not counted against the document
+    get_model()
+    return bench_document(name, file_bytes, file_type, qa, args, StubChatClient(latency=args.llm_latency), out_dir)
+
+
+def run_isolated(name, file_bytes, file_type, qa, args, out_dir):
+    # Each document gets a fresh process, so its peak_rss_mb is its own rather than the largest so far
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_bench_in_child, name, file_bytes, file_type, qa, args, out_dir).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput, latency and recall benchmark for the RAG pipeline")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500], help="synthetic document sizes")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per stubbed completion")
+    parser.add_argument("--skip-llm", action="store_true")
+    parser.add_argument("--no-fixtures", action="store_true")
+    parser.add_argument("--output", default="rag_benchmark.json")
+    args = parser.parse_args()
+
+    out_dir = tempfile.mkdtemp(prefix="rag_bench_")
+    # A fresh embedding cache keeps the cold-embedding numbers honest
+    os.environ["EMBED_CACHE_PATH"] = os.path.join(out_dir, "embed_cache.sqlite")
+
+    from extraction import PDF_MIME, TXT_MIME
+
+    runs = []
+
+    if not args.no_fixtures:
+        for name, data, qa in fixture_documents():
+            runs.append(run_isolated(name, data, TXT_MIME, qa, args, out_dir))
+
+    for num_pages in args.pages:
+        pages, qa = synthetic_document(num_pages, seed=num_pages)
+        runs.append(run_isolated(f"synthetic_{num_pages}p.pdf", to_pdf(pages), PDF_MIME, qa, args, out_dir))
+
+    for run in runs:
+        print(json.dumps({key: value for key, value in run.items() if key != "summarize_levels"}))
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+        "runs": runs
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
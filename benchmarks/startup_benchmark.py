@@ -0,0 +1,59 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each run is a fresh interpreter so import and model-load costs are measured cold
+PROBE = """
+import sys, time, json
+sys.path.insert(0, {root!r})
+timings = {{}}
+started = time.perf_counter()
+import rag
+timings["import_rag_ms"] = (time.perf_counter() - started) * 1000
+timings["model_loaded_at_import"] = rag._model is not None
+if {prewarm}:
+    started = time.perf_counter()
+    rag.prewarm_model()
+    timings["prewarm_call_ms"] = (time.perf_counter() - started) * 1000
+    rag._prewarm_thread.join()
+started = time.perf_counter()
+rag.embed_query("Who is liable for the damage to the leased premises?")
+timings["first_query_ms"] = (time.perf_counter() - started) * 1000
+started = time.perf_counter()
+rag.embed_query("When does the lease terminate?")
+timings["second_query_ms"] = (time.perf_counter() - started) * 1000
+print(json.dumps({{key: round(value, 1) if isinstance(value, float) else value for key, value in timings.items()}}))
+"""
+
+
+def run(prewarm, env):
+    code = PROBE.format(root=ROOT, prewarm=prewarm)
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and first-query latency of the embedding model")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--model-path", help="local model copy, e.g. an ONNX export (sets RAG_MODEL_PATH)")
+    parser.add_argument("--backend", default="torch", help="torch, onnx or openvino (sets RAG_MODEL_BACKEND)")
+    parser.add_argument("--model-file", help="weights file inside the model dir, e.g. onnx/model_qint8_avx512.onnx")
+    args = parser.parse_args()
+
+    env = dict(os.environ, RAG_MODEL_BACKEND=args.backend)
+    if args.model_path:
+        env["RAG_MODEL_PATH"] = args.model_path
+    if args.model_file:
+        env["RAG_MODEL_FILE"] = args.model_file
+
+    for prewarm in (False, True):
+        for _ in range(args.runs):
+            print(json.dumps({"prewarm": prewarm, "backend": args.backend, **run(prewarm, env)}))
+
+
+if __name__ == "__main__":
+    main()
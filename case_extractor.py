@@ -0,0 +1,164 @@
+import os
+import re
+import threading
+import numpy as np
+from chatbot_engine import parse_incident_date
+
+CASE_FIELDS = ["Full Name", "Contact", "Case Type", "Date of Incident", "Description"]
+
+# Confidence given to values that only came from the LLM's JSON
+LLM_CONFIDENCE = 0.75
+CASE_TYPE_THRESHOLD = float(os.getenv("CASE_TYPE_THRESHOLD", "0.45"))
+LOCAL_ONLY_CONFIDENCE = 0.9
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+PHONE_RE = re.compile(r"(?<!\d)(?:\+?1[\s.-]?)?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}(?!\d)")
+NAME_RE = re.compile(
+    r"\b(?:my name is|my name's|name is|name's|call me)\s+([a-z][a-z'-]+(?:\s+[a-z][a-z'-]+){0,2})",
+    re.IGNORECASE
+)
+# "I'm ..." is usually a feeling rather than a name, so it only counts when we just asked for the name
+ANSWER_NAME_RE = re.compile(r"^(?:i am|i'm|im|it's|its)\s+([a-z][a-z'-]+(?:\s+[a-z][a-z'-]+){0,2})[.!]?$", re.IGNORECASE)
+NAME_STOPWORDS = {
+    "a", "an", "the", "not", "so", "very", "really", "hurt", "injured", "okay", "ok", "fine", "good", "here",
+    "looking", "trying", "calling", "writing", "wondering", "sorry", "scared", "worried", "in", "at", "on",
+    "from", "with", "just", "still", "being", "having", "going", "about", "and", "but", "my"
+}
+MONTHS = "january|february|march|april|may|june|july|august|september|october|november|december|jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|nov|dec"
+DATE_RE = re.compile(
+    r"\b(?:yesterday|today|last night|this morning|"
+    r"last (?:week|month|year|monday|tuesday|wednesday|thursday|friday|saturday|sunday)|"
+    r"(?:\d+|a|an|one|two|three|four|five|six|seven|eight|nine|ten) (?:days?|weeks?|months?|years?) ago|"
+    r"\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}/\d{2,4}|"
+    rf"(?:{MONTHS})\.? \d{{1,2}}(?:st|nd|rd|th)?(?:,? \d{{4}})?|"
+    rf"\d{{1,2}}(?:st|nd|rd|th)? (?:of )?(?:{MONTHS})(?:,? \d{{4}})?)\b",
+    re.IGNORECASE
+)
+
+CASE_TYPES = {
+    "Car Accident": "car accident, vehicle crash, hit by a car, rear ended, collision on the road",
+    "Motorcycle Accident": "motorcycle accident, crashed my motorbike, hit while riding a motorcycle",
+    "Truck Accident": "truck accident, semi truck crash, hit by a delivery truck",
+    "Pedestrian Accident": "pedestrian hit by a vehicle while walking or crossing the street",
+    "Slip and Fall": "slip and fall, tripped and fell, wet floor, fell on stairs in a store",
+    "Workplace Injury": "injured at work, hurt on the job, workplace accident, workers compensation",
+    "Medical Malpractice": "medical malpractice, doctor made a mistake, misdiagnosis, surgical error",
+    "Dog Bite": "dog bite, bitten by a dog, attacked by a neighbor's dog",
+    "Landlord/Tenant Dispute": "landlord tenant dispute, mold in apartment, eviction, landlord won't make repairs, security deposit",
+    "Wrongful Termination": "fired unfairly, wrongful termination, let go from my job for no reason",
+    "Employment Discrimination": "discrimination or harassment at work, treated unfairly because of race, gender or age",
+    "Product Liability": "defective product injury, product malfunctioned and hurt me, recalled item"
+}
+
+_label_matrix = None
+_label_names = None
+_label_lock = threading.Lock()
+
+
+def _field(value, confidence, source):
+    return {"value": value, "confidence": round(confidence, 3), "source": source}
+
+
+def classify_case_type(text):
+    # Returns (None, 0.0) when the embedding model can't be used, so the LLM's case type stands
+    global _label_matrix, _label_names
+    try:
+        from rag import embed_normalized
+        with _label_lock:
+            if _label_matrix is None:
+                _label_matrix = embed_normalized([CASE_TYPES[name] for name in CASE_TYPES])
+                _label_names = list(CASE_TYPES)
+        scores = _label_matrix @ embed_normalized([text])[0]
+    except Exception as e:
+        print("Case type model unavailable:", e)
+        return None, 0.0
+    best = int(np.argmax(scores))
+    return _label_names[best], float(scores[best])
+
+
+def extract_contact(text):
+    email = EMAIL_RE.search(text)
+    if email:
+        return _field(email.group(0), 0.97, "regex")
+    phone = PHONE_RE.search(text)
+    if phone:
+        return _field(phone.group(0).strip(), 0.95, "regex")
+    return None
+
+
+def _name_words(phrase):
+    words = []
+    for word in phrase.split():
+        if word.lower() in NAME_STOPWORDS:
+            break
+        words.append(word.capitalize())
+    return " ".join(words)
+
+
+def extract_name(text, awaiting=False):
+    match = NAME_RE.search(text)
+    if match and _name_words(match.group(1)):
+        return _field(_name_words(match.group(1)), 0.9, "pattern")
+    if not awaiting:
+        return None
+    match = ANSWER_NAME_RE.match(text.strip())
+    if match and _name_words(match.group(1)):
+        return _field(_name_words(match.group(1)), 0.85, "answer")
+    # A short, purely alphabetic answer to "what's your name?" is the name itself
+    stripped = re.sub(r"[.!]+$", "", text.strip())
+    if re.fullmatch(r"[a-z][a-z'-]*(?:\s+[a-z][a-z'-]*){0,3}", stripped, re.IGNORECASE):
+        return _field(" ".join(w.capitalize() for w in stripped.split()), 0.8, "answer")
+    return None
+
+
+def extract_date(text, awaiting=False):
+    match = DATE_RE.search(text)
+    if match and parse_incident_date(match.group(0)):
+        return _field(match.group(0), 0.9, "regex")
+    if awaiting and parse_incident_date(text):
+        return _field(text.strip(), 0.7, "dateparser")
+    return None
+
+
+def extract_case_type(text, awaiting=False):
+    if not awaiting and len(text.split()) < 4:
+        return None
+    label, score = classify_case_type(text)
+    # A low-scoring answer to the case-type question is kept verbatim by the caller instead
+    if score >= CASE_TYPE_THRESHOLD:
+        return _field(label, score, "embedding")
+    return None
+
+
+def extract_case_fields(text, awaiting_field=None):
+    fields = {
+        "Contact": extract_contact(text),
+        "Full Name": extract_name(text, awaiting=awaiting_field == "Full Name"),
+        "Date of Incident": extract_date(text, awaiting=awaiting_field == "Date of Incident"),
+        "Case Type": extract_case_type(text, awaiting=awaiting_field == "Case Type"),
+        "Description": _field(text.strip(), 0.9, "answer") if awaiting_field == "Description" else None
+    }
+    return {key: value for key, value in fields.items() if value}
+
+
+def merge_case_fields(local_fields, llm_data=None):
+    # Keeps the higher-confidence value per field; returns {field: {"value", "confidence", "source"}}
+    merged = {}
+    for key in CASE_FIELDS:
+        candidates = []
+        if key in local_fields:
+            candidates.append(local_fields[key])
+        llm_value = (llm_data or {}).get(key)
+        if isinstance(llm_value, str) and llm_value.strip():
+            candidates.append(_field(llm_value.strip(), LLM_CONFIDENCE, "llm"))
+        if candidates:
+            merged[key] = max(candidates, key=lambda field: field["confidence"])
+    return merged
+
+
+def resolves_without_llm(local_fields):
+    # Turns that only supply contact details, names or dates don't need a generated reply
+    return bool(local_fields) and all(
+        field["confidence"] >= LOCAL_ONLY_CONFIDENCE and key in ("Full Name", "Contact", "Date of Incident")
+        for key, field in local_fields.items()
+    )
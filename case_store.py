@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "postgres" (default) or "sqlite" as a local stand-in
+CASE_DB_BACKEND = os.getenv("CASE_DB_BACKEND", "postgres")
+CASE_SQLITE_PATH = os.getenv("CASE_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "lawfirm_bot.sqlite"))
+CASE_POOL_MIN = int(os.getenv("CASE_POOL_MIN", "1"))
+CASE_POOL_MAX = int(os.getenv("CASE_POOL_MAX", "10"))
+CASE_WRITE_BEHIND = os.getenv("CASE_WRITE_BEHIND", "0") == "1"
+CASE_BATCH_SIZE = int(os.getenv("CASE_BATCH_SIZE", "50"))
+CASE_FLUSH_INTERVAL = float(os.getenv("CASE_FLUSH_INTERVAL", "1.0"))
+CASE_MAX_RETRIES = int(os.getenv("CASE_MAX_RETRIES", "3"))
+# Cases wait here as one JSON file each until they are committed
+CASE_SPOOL_DIR = os.getenv("CASE_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "lawfirm_bot_spool"))
+CASE_REPLAY_INTERVAL = float(os.getenv("CASE_REPLAY_INTERVAL", "30"))
+
+COLUMNS = ("name", "contact", "case_type", "date_of_incident", "description")
+# Rows the database refuses outright; any other error (outage, pool exhausted, missing table) is retried
+BAD_DATA_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError, sqlite3.IntegrityError)
+
+
+def _backoff(attempt):
+    return min(30.0, 0.5 * (2 ** attempt))
+
+
+class CaseStore:
+    def __init__(self, backend=None, write_behind=None, spool_dir=None):
+        self.backend = backend or CASE_DB_BACKEND
+        self.write_behind = CASE_WRITE_BEHIND if write_behind is None else write_behind
+        self.spool_dir = spool_dir or CASE_SPOOL_DIR
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.in_flight = set()
+        self.in_flight_lock = threading.Lock()
+        self.worker = None
+
+        if self.backend == "sqlite":
+            with self.connection() as conn:
+                conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS intake_cases (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        {", ".join(f"{column} TEXT" for column in COLUMNS)}
+                    )
+                """)
+                conn.commit()
+
+    @contextmanager
+    def connection(self):
+        if self.backend == "sqlite":
+            conn = sqlite3.connect(CASE_SQLITE_PATH, timeout=10)
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = ThreadedConnectionPool(
+                    CASE_POOL_MIN,
+                    CASE_POOL_MAX,
+                    host=os.getenv("POSTGRES_HOST", "localhost"),
+                    database=os.getenv("POSTGRES_DB", "lawfirm_bot"),
+                    user=os.getenv("POSTGRES_USER", "postgres"),
+                    password=os.getenv("POSTGRES_PASSWORD")
+                )
+        conn = self.pool.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if not broken:
+                conn.rollback()
+            self.pool.putconn(conn, close=broken)
+
+    def insert_many(self, records):
+        rows = [tuple(record[column] for column in COLUMNS) for record in records]
+        with self.connection() as conn:
+            if self.backend == "sqlite":
+                conn.executemany(
+                    f"INSERT INTO intake_cases ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                    rows
+                )
+            else:
+                with conn.cursor() as cur:
+                    execute_values(cur, f"INSERT INTO intake_cases ({', '.join(COLUMNS)}) VALUES %s", rows)
+            conn.commit()
+
+    def _spool(self, record):
+        path = os.path.join(self.spool_dir, f"{time.time():.6f}-{uuid.uuid4().hex}.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return path
+
+    def _enqueue(self, path):
+        with self.in_flight_lock:
+            if path in self.in_flight:
+                return
+            self.in_flight.add(path)
+        self.queue.put(path)
+
+    def save(self, record):
+        self._ensure_worker()
+        if self.write_behind:
+            self._enqueue(self._spool(record))
+            return "queued"
+
+        for attempt in range(CASE_MAX_RETRIES + 1):
+            try:
+                self.insert_many([record])
+                return "saved"
+            except Exception as e:
+                print(f"Error saving case (attempt {attempt + 1}):", e)
+                if attempt < CASE_MAX_RETRIES:
+                    time.sleep(_backoff(attempt))
+
+        # The worker replays spooled cases once the database is back
+        self._spool(record)
+        return "spooled"
+
+    def pending(self):
+        return len([name for name in os.listdir(self.spool_dir) if name.endswith(".json")])
+
+    def _ensure_worker(self):
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = threading.Thread(target=self._run, name="case-store-writer", daemon=True)
+            self.worker.start()
+
+    def _replay_spool(self):
+        for name in sorted(os.listdir(self.spool_dir)):
+            if name.endswith(".json"):
+                self._enqueue(os.path.join(self.spool_dir, name))
+
+    def _next_batch(self):
+        batch = []
+        deadline = time.monotonic() + CASE_FLUSH_INTERVAL
+        while len(batch) < CASE_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, paths):
+        records, loaded = [], []
+        for path in paths:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    records.append(json.load(f))
+                loaded.append(path)
+            except (OSError, ValueError) as e:
+                print("Skipping unreadable spooled case:", path, e)
+
+        attempt, stored = 0, []
+        while records:
+            try:
+                self.insert_many(records)
+                stored = loaded
+                break
+            except BAD_DATA_ERRORS as e:
+                # Write rows one at a time and park the ones the database still rejects
+                print("Batch insert rejected, retrying cases individually:", e)
+                for path, record in zip(loaded, records):
+                    try:
+                        self.insert_many([record])
+                        stored.append(path)
+                    except BAD_DATA_ERRORS as row_error:
+                        print("Case could not be stored, kept in spool as .failed:", path, row_error)
+                        os.replace(path, path[:-len(".json")] + ".failed")
+                    except Exception as row_error:
+                        # The rest stay spooled and are picked up by the next replay
+                        print("Error writing spooled case, leaving the rest for replay:", row_error)
+                        break
+                break
+            except Exception as e:
+                print(f"Error writing {len(records)} spooled case(s), retrying:", e)
+                time.sleep(_backoff(attempt))
+                attempt += 1
+
+        for path in stored:
+            os.remove(path)
+        with self.in_flight_lock:
+            self.in_flight.difference_update(paths)
+
+    def _run(self):
+        self._replay_spool()
+        last_replay = time.monotonic()
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+            if time.monotonic() - last_replay >= CASE_REPLAY_INTERVAL:
+                self._replay_spool()
+                last_replay = time.monotonic()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_case_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CaseStore()
+        return _store
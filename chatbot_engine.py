@@ -1,37 +1,141 @@
-import psycopg2
 import os
 import json
 import re
-from datetime import datetime, timedelta
+import time
+import queue
+import hashlib
+import threading
+from functools import lru_cache
+from datetime import datetime, timedelta, time as dt_time
 import dateparser
 from openai import OpenAI
 from dotenv import load_dotenv
+from case_store import get_case_store
+from conversation import ConversationMemory, count_message_tokens, count_tokens
+from metrics import timed, span, observe, annotate, record_llm_usage, METRICS_ENABLED
 
 load_dotenv()
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+@timed("save_case")
 def save_case(name, contact, case_type, date, description):
     try:
-        conn = psycopg2.connect(
-            host="localhost",
-            database="lawfirm_bot",
-            user="postgres",
-            password=os.getenv("POSTGRES_PASSWORD")
-        )
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO intake_cases (name, contact, case_type, date_of_incident, description)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (name, contact, case_type, date, description))
-        conn.commit()
-        cur.close()
-        conn.close()
+        status = get_case_store().save({
+            "name": name,
+            "contact": contact,
+            "case_type": case_type,
+            "date_of_incident": date,
+            "description": description
+        })
+        if status == "spooled":
+            print("Database unavailable, case spooled for retry")
+        return status
     except Exception as e:
         print("Error saving case:", e)
 
-def extract_case_info_prompt_only(user_input):
-    prompt = f"""
+CHAT_MODEL = "gpt-4-0613"
+
+class ReplyJsonSplitter:
+    # Separates the conversational reply from the case-info JSON while tokens are still arriving
+    FENCE = "```"
+
+    def __init__(self):
+        self.visible = ""
+        self.json_text = None
+        self._pending = ""
+        self._fence = ""
+        self._object = ""
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._closing = None
+
+    @classmethod
+    def _opener(cls, text):
+        # "open" once text is '{' plus a quoted key (optionally after a ```json fence), "maybe" while it could still become one
+        rest = text
+        if text.startswith(cls.FENCE):
+            rest = text[len(cls.FENCE):]
+            if len(rest) < 4 and "json".startswith(rest):
+                return "maybe"
+            rest = rest[4:].lstrip() if rest.startswith("json") else rest.lstrip()
+            if not rest:
+                return "maybe"
+        elif cls.FENCE.startswith(text):
+            return "maybe"
+        if not rest.startswith("{"):
+            return None
+        rest = rest[1:].lstrip()
+        if not rest:
+            return "maybe"
+        return "open" if rest == '"' else None
+
+    def _consume(self, ch):
+        self._object += ch
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+        elif ch == '"':
+            self._in_string = True
+        elif ch == "{":
+            self._depth += 1
+        elif ch == "}":
+            self._depth -= 1
+            if self._depth == 0:
+                if self.json_text is None:
+                    self.json_text = self._object
+                # Only a fence that opened this object is closed with it
+                self._closing = "" if self._fence else None
+                self._object, self._fence = "", ""
+
+    def feed(self, delta):
+        out = []
+        text, i = delta, 0
+        while i < len(text):
+            ch = text[i]
+            i += 1
+            if self._depth:
+                self._consume(ch)
+                continue
+            if self._closing is not None:
+                self._closing += ch
+                rest = self._closing.lstrip()
+                if rest == self.FENCE:
+                    self._closing = None
+                elif not self.FENCE.startswith(rest):
+                    text, i = self._closing + text[i:], 0
+                    self._closing = None
+                continue
+            self._pending += ch
+            state = self._opener(self._pending)
+            if state == "open":
+                start = self._pending.index("{")
+                self._fence, self._object = self._pending[:start], self._pending[start:]
+                self._depth, self._in_string, self._pending = 1, True, ""
+            elif state is None:
+                # Not an opener after all; its first character is text and the rest is scanned again
+                out.append(self._pending[0])
+                if len(self._pending) > 1:
+                    text, i = self._pending[1:] + text[i:], 0
+                self._pending = ""
+        text = "".join(out)
+        self.visible += text
+        return text
+
+    def finish(self):
+        # An opener or object that never completed was not JSON after all, so it is shown as text
+        text = self._pending + self._fence + self._object + (self._closing or "")
+        self._pending, self._fence, self._object, self._closing = "", "", "", None
+        self._depth, self._in_string, self._escape = 0, False, False
+        self.visible += text
+        return text
+
+CASE_SYSTEM_PROMPT = """
 You are Jed.ai, a smart and reliable legal intake assistant for a law firm. You were created by Siddharth Gajraj who goes by Sid
 
 Your job is to help users share their legal issues by:
@@ -45,13 +149,13 @@ Your job is to help users share their legal issues by:
 
 1. **If it's a greeting** (like “hey”, “hi”), respond warmly and invite the user to describe what happened.
 2. **If they describe an incident**, respond naturally (no checklist!), and extract the following JSON **in the background**:
-{{
+{
   "Full Name": "...",
   "Contact": "...",
   "Case Type": "...",
   "Date of Incident": "...",
   "Description": "One-line summary"
-}}
+}
 If any part is missing, leave it blank — **don’t ask for it unless the user seems ready**.
 
 3. **If it’s a legal question**, answer clearly and briefly. Don’t extract JSON.
@@ -69,13 +173,13 @@ If any part is missing, leave it blank — **don’t ask for it unless the user
 **You:**
 I'm so sorry to hear that, Manny. That must’ve been scary. Are you okay?
 
-{{
+{
   "Full Name": "Manny",
   "Contact": "xxx-xxx-xxxx",
   "Case Type": "Car Accident",
   "Date of Incident": "last week",
   "Description": "Manny was hit by a car last week."
-}}
+}
 
 ---
 
@@ -97,60 +201,242 @@ I’m really sorry to hear that. Would you feel comfortable telling me when it h
 
 ---
 
-Now respond to this message like a human — and include JSON only if the details are clear enough:
+Respond to the user's latest message like a human — and include JSON only if the details are clear enough.
+When you include JSON, fill it from the whole conversation and the case details already collected, not just the latest message.
+"""
 
+def build_case_messages(user_input, memory=None, case_data=None):
+    # Stable system prefix, then the rolling summary / known case fields, recent turns and the new message
+    memory = memory or ConversationMemory()
+    messages = memory.build_messages(CASE_SYSTEM_PROMPT, user_input, case_data=case_data)
+    if METRICS_ENABLED:
+        annotate(prompt_messages=len(messages), prompt_tokens_estimate=count_message_tokens(messages))
+    return messages
 
-\"\"\"{user_input}\"\"\"
-"""
+def extract_case_info_prompt_only(user_input, memory=None, case_data=None):
+    with span("chat_completion", model=CHAT_MODEL):
+        response = client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=build_case_messages(user_input, memory, case_data),
+            temperature=0.2
+        )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            record_llm_usage(CHAT_MODEL, usage.prompt_tokens, usage.completion_tokens)
+    return response.choices[0].message.content.strip()
 
-    response = client.chat.completions.create(
-    model="gpt-4-0613",
-    messages=[{"role":"user","content":prompt}],
-    temperature=0.2
+def stream_case_info(user_input, memory=None, case_data=None):
+    messages = build_case_messages(user_input, memory, case_data)
+    started = time.perf_counter()
+    stream = client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=messages,
+        temperature=0.2,
+        stream=True
     )
-    return response.choices[0].message.content.strip()
+    parts = []
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            if not parts:
+                observe("chat_first_token", time.perf_counter() - started)
+            parts.append(chunk.choices[0].delta.content)
+            yield chunk.choices[0].delta.content
+    observe("chat_stream", time.perf_counter() - started)
+    # Streamed responses carry no usage block, so tokens are counted locally (only when they are recorded)
+    if METRICS_ENABLED:
+        record_llm_usage(CHAT_MODEL, count_message_tokens(messages), count_tokens("".join(parts)))
 
-def parse_incident_date(date_str):
-    date_str = date_str.lower().strip()
-    today = datetime.today()
-    match = re.match(r"last (\w+)", date_str)
+DATE_LANGUAGES = [lang.strip() for lang in os.getenv("DATE_LANGUAGES", "en").split(",") if lang.strip()]
+
+WEEKDAYS = {
+    "monday": 0, "tuesday": 1, "wednesday": 2,
+    "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6
+}
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10
+}
+SAME_DAY = {"today", "tonight", "this morning", "this afternoon", "this evening", "earlier today"}
+PREVIOUS_DAY = {"yesterday", "last night", "yesterday morning", "yesterday afternoon", "yesterday evening"}
+
+LAST_WEEKDAY_RE = re.compile(r"last (\w+)")
+AGO_RE = re.compile(r"^(\d+|" + "|".join(NUMBER_WORDS) + r") (day|week|month|year)s? ago$")
+ISO_DATE_RE = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})$")
+US_DATE_RE = re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{4}|\d{2})$")
+
+def _months_back(base, months):
+    month_index = base.year * 12 + base.month - 1 - months
+    year, month = divmod(month_index, 12)
+    month += 1
+    for day in range(base.day, 27, -1):
+        try:
+            return base.replace(year=year, month=month, day=day)
+        except ValueError:
+            continue
+    return base.replace(year=year, month=month, day=min(base.day, 28))
+
+def _fast_parse_date(date_str, today):
+    # Precompiled rules for the phrases users type most; anything else falls through to dateparser
+    if date_str in SAME_DAY:
+        return today
+    if date_str in PREVIOUS_DAY:
+        return today - timedelta(days=1)
+    if date_str == "last week":
+        return today - timedelta(days=7)
+    if date_str == "last month":
+        return _months_back(today, 1)
+    if date_str == "last year":
+        return _months_back(today, 12)
+
+    match = LAST_WEEKDAY_RE.match(date_str)
+    if match and match.group(1) in WEEKDAYS:
+        delta_days = (today.weekday() - WEEKDAYS[match.group(1)] + 7) % 7 or 7
+        return today - timedelta(days=delta_days)
+
+    match = AGO_RE.match(date_str)
     if match:
-        weekday_str = match.group(1).capitalize()
-        weekdays = {
-            "Monday": 0, "Tuesday": 1, "Wednesday": 2,
-            "Thursday": 3, "Friday": 4, "Saturday": 5, "Sunday": 6
-        }
-        if weekday_str in weekdays:
-            today_weekday = today.weekday()
-            target_weekday = weekdays[weekday_str]
-            delta_days = (today_weekday - target_weekday + 7) % 7 or 7
-            return today - timedelta(days=delta_days)
-    parsed = dateparser.parse(
+        count = int(match.group(1)) if match.group(1).isdigit() else NUMBER_WORDS[match.group(1)]
+        unit = match.group(2)
+        if unit == "day":
+            return today - timedelta(days=count)
+        if unit == "week":
+            return today - timedelta(weeks=count)
+        return _months_back(today, count if unit == "month" else count * 12)
+
+    match = ISO_DATE_RE.match(date_str) or US_DATE_RE.match(date_str)
+    if match:
+        if match.re is ISO_DATE_RE:
+            year, month, day = (int(g) for g in match.groups())
+        else:
+            month, day, year = (int(g) for g in match.groups())
+            if year < 100:
+                year += 2000 if 2000 + year <= today.year else 1900
+        try:
+            return today.replace(year=year, month=month, day=day)
+        except ValueError:
+            return None
+    return None
+
+@lru_cache(maxsize=4096)
+def _resolve_date(date_str, reference_day):
+    # Relative dates are resolved against noon of the reference day so results can be shared for the whole day
+    today = datetime.combine(reference_day, dt_time(12))
+    parsed = _fast_parse_date(date_str, today)
+    if parsed:
+        return parsed
+    return dateparser.parse(
         date_str,
+        languages=DATE_LANGUAGES,
         settings={"PREFER_DATES_FROM": "past", "RELATIVE_BASE": today}
     )
-    return parsed
+
+def parse_incident_date(date_str):
+    date_str = date_str.lower().strip()
+    return _resolve_date(date_str, datetime.today().date())
+
+def warm_date_parser():
+    # dateparser loads its language data on first use; pay that once at startup instead of on a user turn
+    try:
+        dateparser.parse("3 weeks ago", languages=DATE_LANGUAGES)
+    except Exception as e:
+        print("Could not warm dateparser:", e)
+
+threading.Thread(target=warm_date_parser, name="dateparser-warmup", daemon=True).start()
+
+CASE_QUEUE_SIZE = int(os.getenv("CASE_QUEUE_SIZE", "100"))
+CASE_QUEUE_TIMEOUT = float(os.getenv("CASE_QUEUE_TIMEOUT", "0.5"))
 
 def handle_case_storage(gpt_output):
+    # Returns "saved", "queued", "spooled", "invalid" or "error"
     try:
         gpt_output_clean = gpt_output.strip()
         json_start = gpt_output_clean.find('{')
         if json_start == -1:
             print("No JSON found in GPT output.")
-            return
+            return "invalid"
         gpt_json = gpt_output_clean[json_start:]
         data = json.loads(gpt_json)
         parsed_date = parse_incident_date(data["Date of Incident"])
         if not parsed_date:
             print("Could not parse the date:", data["Date of Incident"])
-            return
-        save_case(
+            return "invalid"
+        status = save_case(
             name=data["Full Name"],
             contact=data["Contact"],
             case_type=data["Case Type"],
             date=parsed_date.strftime("%Y-%m-%d"),
             description=data["Description"]
         )
+        if not status:
+            return "error"
         print("Case saved successfully")
+        return status
     except Exception as e:
-        print("Error while saving case info:", e)
\ No newline at end of file
+        print("Error while saving case info:", e)
+        return "invalid" if isinstance(e, (ValueError, KeyError, TypeError)) else "error"
+
+class CaseSubmitter:
+    # Runs handle_case_storage on a background thread so database latency never reaches the chat turn
+    def __init__(self, max_queue=None):
+        self.queue = queue.Queue(maxsize=max_queue or CASE_QUEUE_SIZE)
+        self.statuses = {}
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def submission_key(self, session_id, gpt_output):
+        try:
+            payload = json.dumps(json.loads(gpt_output[gpt_output.find('{'):]), sort_keys=True)
+        except ValueError:
+            payload = gpt_output.strip()
+        return hashlib.sha256(f"{session_id}\0{payload}".encode("utf-8")).hexdigest()
+
+    def submit(self, gpt_output, session_id=""):
+        # Idempotent per (session, case content): repeat calls return the existing submission
+        key = self.submission_key(session_id, gpt_output)
+        with self.lock:
+            if key in self.statuses and self.statuses[key] != "error":
+                return key
+            self.statuses[key] = "pending"
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name="case-submitter", daemon=True)
+                self.worker.start()
+        try:
+            self.queue.put((key, gpt_output), timeout=CASE_QUEUE_TIMEOUT)
+        except queue.Full:
+            # Back-pressure: store on the caller's thread rather than drop the case
+            print("Case queue full, storing synchronously")
+            self._store(key, gpt_output)
+        return key
+
+    def status(self, key):
+        with self.lock:
+            return self.statuses.get(key)
+
+    def _store(self, key, gpt_output):
+        status = handle_case_storage(gpt_output)
+        with self.lock:
+            self.statuses[key] = status
+
+    def _run(self):
+        while True:
+            key, gpt_output = self.queue.get()
+            try:
+                self._store(key, gpt_output)
+            finally:
+                self.queue.task_done()
+
+_submitter = None
+_submitter_lock = threading.Lock()
+
+def get_case_submitter():
+    global _submitter
+    with _submitter_lock:
+        if _submitter is None:
+            _submitter = CaseSubmitter()
+        return _submitter
+
+def submit_case_storage(gpt_output, session_id=""):
+    return get_case_submitter().submit(gpt_output, session_id)
+
+def case_storage_status(key):
+    return get_case_submitter().status(key)
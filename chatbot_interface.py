@@ -1,8 +1,16 @@
 import streamlit as st
-from chatbot_engine import extract_case_info_prompt_only, handle_case_storage
+from chatbot_engine import extract_case_info_prompt_only, stream_case_info, ReplyJsonSplitter, submit_case_storage, case_storage_status
+from intent_router import route_intent
+from semantic_cache import get_semantic_cache
+from case_extractor import extract_case_fields, merge_case_fields, resolves_without_llm
+from rag import prewarm_model
+from conversation import ConversationMemory
+from metrics import trace, span, start_exporters
+import os
 import base64
 import json
 import random
+import uuid
 
 
 def strip_json_from_reply(reply):
@@ -17,6 +25,8 @@ def strip_json_from_reply(reply):
 
 
 st.set_page_config(page_title="Jed.ai Legal Assistant")
+prewarm_model()
+start_exporters()
 
 
 
@@ -42,6 +52,23 @@ if "field_queue" not in st.session_state:
 if "awaiting_field" not in st.session_state:
     st.session_state.awaiting_field = None
 
+if "case_confidence" not in st.session_state:
+    st.session_state.case_confidence = {}
+
+if "pending_input" not in st.session_state:
+    st.session_state.pending_input = None
+
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+if "case_submission" not in st.session_state:
+    st.session_state.case_submission = None
+
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationMemory()
+
+CHAT_STREAMING = os.getenv("CHAT_STREAMING", "1") == "1"
+
 def get_conversational_prompt(field):
     prompts = {
         "Full Name": [
@@ -73,119 +100,203 @@ def get_conversational_prompt(field):
     return random.choice(prompts.get(field, ["Could you tell me more?"]))
 
 
+def has_personal_context():
+    # True when the next prompt will carry earlier turns or collected case details
+    memory = st.session_state.memory
+    memory.sync(st.session_state.chat_blocks)
+    return bool(memory.turns or memory.summary_lines or any(st.session_state.case_data.values()))
+
+
+def generate_reply(user_input, placeholder=None):
+    # Returns (full GPT output, visible reply, case JSON text or None)
+    memory = st.session_state.memory
+    memory.sync(st.session_state.chat_blocks)
+    case_data = st.session_state.case_data
+    if not CHAT_STREAMING or placeholder is None:
+        with span("generate_reply", streaming=False):
+            gpt_output = extract_case_info_prompt_only(user_input, memory, case_data)
+        splitter = ReplyJsonSplitter()
+        splitter.feed(gpt_output)
+        splitter.finish()
+        return gpt_output, splitter.visible.strip(), splitter.json_text
+
+    splitter = ReplyJsonSplitter()
+    parts = []
+    with span("generate_reply", streaming=True):
+        for delta in stream_case_info(user_input, memory, case_data):
+            parts.append(delta)
+            if splitter.feed(delta):
+                placeholder.markdown(splitter.visible.strip().replace("\n", "  \n") + " ▌")
+    splitter.finish()
+    placeholder.empty()
+    return "".join(parts).strip(), splitter.visible.strip(), splitter.json_text
+
+
+def submit_case():
+    # Storage runs in the background; returns False when this exact case was already submitted
+    key = submit_case_storage(json.dumps(st.session_state.case_data), st.session_state.session_id)
+    if key == st.session_state.case_submission:
+        return False
+    st.session_state.case_submission = key
+    return True
+
+
+def record_local_fields(user_input, local_fields, recorded_message):
+    for key, extracted in local_fields.items():
+        st.session_state.case_data[key] = extracted["value"]
+        st.session_state.case_confidence[key] = extracted["confidence"]
+
+    missing = [k for k, v in st.session_state.case_data.items() if not v]
+    st.session_state.field_queue = missing
+    st.session_state.awaiting_field = missing[0] if missing else None
+
+    follow_up = ""
+    if st.session_state.awaiting_field:
+        follow_up = get_conversational_prompt(st.session_state.awaiting_field)
+
+    st.session_state.chat_blocks.append({
+        "user": user_input,
+        "assistant": recorded_message + (f"\n\n{follow_up}" if follow_up else "")
+    })
+
+    if not missing and submit_case():
+        st.session_state.chat_blocks.append({
+            "user": "",
+            "assistant": "Thank you for sharing your details. A member of our team will be in touch with you shortly to assist further."
+        })
+
+
 def handle_submit():
     user_input = st.session_state.user_input.strip()
+    if user_input:
+        st.session_state.pending_input = user_input
+    st.session_state.user_input = ""
 
+
+def process_input(user_input, placeholder=None):
  
     if not user_input:
         return
 
     user_input = user_input.lower()
 
-    legal_keywords =  ["should", "can i", "do i have", "is it legal", "sue", "lawsuit", "claim", "liable", "why"]
-    if any(kw in user_input for kw in legal_keywords):
-        gpt_output = extract_case_info_prompt_only(user_input)
+    # Greetings, thanks and contact requests are answered locally without a GPT-4 call
+    intent, confidence, local_reply = route_intent(user_input, allow_fuzzy=not st.session_state.awaiting_field)
+    if local_reply:
         st.session_state.chat_blocks.append({
             "user": user_input,
-            "assistant": gpt_output
+            "assistant": local_reply,
+            "reply": local_reply
         })
         st.session_state.awaiting_field = None
-        st.session_state.user_input = ""
         return
 
- 
-    casual_inputs = [
-        "hi", "hello", "hey", "how are you", "good morning", "good evening",
-        "what's up", "sup", "yo", "how’s it going", "how r u"
-    ]
-    if user_input in casual_inputs:
-        gpt_output = extract_case_info_prompt_only(user_input)
+    if intent == "legal_question" and confidence == 1.0:
+        # Answers shared through the cache are generated from the question alone; once this user has
+        # conversation history or case details, "can I sue him for that?" needs them, so the cache is skipped
+        personal = has_personal_context()
+        cache = get_semantic_cache()
+        cached_reply = None if personal else cache.lookup(user_input)[0]
+        if cached_reply:
+            st.session_state.chat_blocks.append({
+                "user": user_input,
+                "assistant": cached_reply,
+                "reply": cached_reply
+            })
+            st.session_state.awaiting_field = None
+            return
+
+        gpt_output, reply, json_block = generate_reply(user_input, placeholder)
         st.session_state.chat_blocks.append({
             "user": user_input,
-            "assistant": gpt_output
+            "assistant": gpt_output,
+            "reply": reply
         })
+        # A reply that extracted case info is about this user too
+        if reply and not json_block and not personal:
+            cache.store(user_input, reply)
         st.session_state.awaiting_field = None
-        st.session_state.user_input = ""
         return
 
  
     if st.session_state.awaiting_field:
         field = st.session_state.awaiting_field
-        st.session_state.case_data[field] = user_input
-        missing = [k for k, v in st.session_state.case_data.items() if not v]
-        st.session_state.field_queue = missing
-        st.session_state.awaiting_field = missing[0] if missing else None
-
-        follow_up = ""
-        if st.session_state.awaiting_field:
-            follow_up = get_conversational_prompt(st.session_state.awaiting_field)
-
-        st.session_state.chat_blocks.append({
-            "user": user_input,
-            "assistant": f"{field} recorded. Thank you!" + (f"\n\n{follow_up}" if follow_up else "")
-    })
+        local_fields = extract_case_fields(user_input, awaiting_field=field)
+        if field not in local_fields:
+            local_fields[field] = {"value": user_input, "confidence": 0.5, "source": "verbatim"}
+        # Other details volunteered in the same answer only fill blanks
+        local_fields = {key: value for key, value in local_fields.items() if key == field or not st.session_state.case_data[key]}
+        record_local_fields(user_input, local_fields, f"{field} recorded. Thank you!")
+        return
 
 
-        if not missing:
-            json_ready = json.dumps(st.session_state.case_data)
-            handle_case_storage(json_ready)
-            st.session_state.chat_blocks.append({
-                "user": "",
-                "assistant": "Thank you for sharing your details. A member of our team will be in touch with you shortly to assist further."
-            })
-
-        st.session_state.user_input = ""
+    # Follow-ups that only give a name, contact or date are filled in locally without an API call
+    local_fields = extract_case_fields(user_input)
+    if st.session_state.case_data["Description"] and resolves_without_llm(local_fields):
+        record_local_fields(user_input, local_fields, f"{', '.join(local_fields)} recorded. Thank you!")
         return
 
 
     if user_input:
-        gpt_output = extract_case_info_prompt_only(user_input)
+        gpt_output, reply, json_block = generate_reply(user_input, placeholder)
         st.session_state.chat_blocks.append({
             "user": user_input,
-            "assistant": gpt_output
+            "assistant": gpt_output,
+            "reply": reply
         })
 
-        try:
-            json_start = gpt_output.find("{")
-            json_end = gpt_output.rfind("}") + 1
-            if json_start != -1 and json_end != -1:
-                json_block = gpt_output[json_start:json_end]
+        data = {}
+        if json_block:
+            try:
                 data = json.loads(json_block)
-
-             
-                for key in st.session_state.case_data:
-                    if key in data and data[key].strip():
-                        st.session_state.case_data[key] = data[key].strip()
-
-                
-                filled_fields = [key for key in data if key in st.session_state.case_data and data[key].strip()]
-                no_fields_updated = len(filled_fields) == 0
-
-               
-                if not no_fields_updated:
-                    missing_fields = [key for key, val in st.session_state.case_data.items() if not val]
-                    st.session_state.field_queue = missing_fields
-                    st.session_state.awaiting_field = missing_fields[0] if missing_fields else None
-
-                    if not missing_fields:
-                        handle_case_storage(json_block)
-                        st.session_state.chat_blocks.append({
-                            "user": "",
-                            "assistant": "Our human agent will reach out to you shortly."
-                        })
-                else:
-                    st.session_state.awaiting_field = None
-
-        except Exception as e:
-            print("GPT response had no valid JSON:", e)
-
-
-        st.session_state.user_input = ""
+            except ValueError as e:
+                print("GPT response had no valid JSON:", e)
+
+        # Local regex/embedding extraction backs up the LLM JSON, so malformed output doesn't lose the case;
+        # with no JSON at all the model judged this not to be case info, e.g. a question mentioning "today"
+        if json_block is None:
+            local_fields = {}
+        merged = merge_case_fields(local_fields, data if isinstance(data, dict) else {})
+        for key, extracted in merged.items():
+            st.session_state.case_data[key] = extracted["value"]
+            st.session_state.case_confidence[key] = extracted["confidence"]
+        if merged:
+            missing_fields = [key for key, val in st.session_state.case_data.items() if not val]
+            st.session_state.field_queue = missing_fields
+            st.session_state.awaiting_field = missing_fields[0] if missing_fields else None
+
+            if not missing_fields and submit_case():
+                st.session_state.chat_blocks.append({
+                    "user": "",
+                    "assistant": "Our human agent will reach out to you shortly."
+                })
+        else:
+            st.session_state.awaiting_field = None
 
 
 st.text_input("Ask a question:", key="user_input", on_change=handle_submit)
 st.markdown("---")
 
+stream_placeholder = st.empty()
+if st.session_state.pending_input:
+    pending_input = st.session_state.pending_input
+    st.session_state.pending_input = None
+    with trace("chat_turn", awaiting_field=st.session_state.awaiting_field):
+        process_input(pending_input, stream_placeholder)
+
+if st.session_state.case_submission:
+    case_status = case_storage_status(st.session_state.case_submission)
+    status_messages = {
+        "pending": "Saving your case details…",
+        "saved": "Your case details have been saved.",
+        "queued": "Your case details have been received.",
+        "spooled": "Your case details have been received and will be saved shortly.",
+        "invalid": "We couldn't save your case details automatically; our team will follow up.",
+        "error": "We couldn't save your case details automatically; our team will follow up."
+    }
+    if case_status in status_messages:
+        st.caption(status_messages[case_status])
+
 
 
 for i, msg in reversed(list(enumerate(st.session_state.chat_blocks))):
@@ -218,7 +329,7 @@ for i, msg in reversed(list(enumerate(st.session_state.chat_blocks))):
 
             
             else:
-                clean_reply = strip_json_from_reply(assistant_reply)
+                clean_reply = msg["reply"] if "reply" in msg else strip_json_from_reply(assistant_reply)
                 if clean_reply:
                     st.markdown(clean_reply.replace("\n", "  \n"))
 
@@ -0,0 +1,110 @@
+import os
+import re
+from llm_pool import estimate_tokens
+
+# Recent turns go to the model verbatim; older ones are folded into a short rolling summary
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "3000"))
+CHAT_RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", "6"))
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "300"))
+TURN_CLIP_TOKENS = 60
+# Per-message framing tokens in the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+JSON_BLOCK_RE = re.compile(r"```json.*?```|\{[^{}]*\}", re.DOTALL)
+
+try:
+    import tiktoken
+    _encoding = tiktoken.encoding_for_model("gpt-4")
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text):
+    if _encoding is None:
+        return estimate_tokens(text)
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages):
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def clip(text, max_tokens):
+    text = " ".join(text.split())
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    while words and count_tokens(" ".join(words)) > max_tokens:
+        words = words[:max(1, len(words) * 3 // 4)] if len(words) > 1 else []
+    return " ".join(words) + " …"
+
+
+def compact_reply(block):
+    reply = block.get("reply")
+    if reply is None:
+        reply = JSON_BLOCK_RE.sub("", block.get("assistant", ""))
+    return reply.strip()
+
+
+class ConversationMemory:
+    def __init__(self, recent_turns=None, summary_tokens=None):
+        self.recent_turns = recent_turns or CHAT_RECENT_TURNS
+        self.summary_tokens = summary_tokens or CHAT_SUMMARY_TOKENS
+        self.turns = []
+        self.summary_lines = []
+        self.synced = 0
+
+    def add_turn(self, user, reply):
+        self.turns.append((user.strip(), reply.strip()))
+        while len(self.turns) > self.recent_turns:
+            self._fold(*self.turns.pop(0))
+
+    def sync(self, chat_blocks):
+        # Picks up blocks appended to st.session_state.chat_blocks since the last call
+        for block in chat_blocks[self.synced:]:
+            if block.get("user") or block.get("assistant"):
+                self.add_turn(block.get("user", ""), compact_reply(block))
+        self.synced = len(chat_blocks)
+
+    def _fold(self, user, reply):
+        line = f"- User: {clip(user, TURN_CLIP_TOKENS)}" if user else ""
+        if reply:
+            line += ("; " if line else "- ") + f"Jed.ai: {clip(reply, TURN_CLIP_TOKENS // 2)}"
+        self.summary_lines.append(line)
+        while len(self.summary_lines) > 1 and count_tokens("\n".join(self.summary_lines)) > self.summary_tokens:
+            self.summary_lines.pop(0)
+
+    def state_message(self, case_data=None):
+        parts = []
+        if self.summary_lines:
+            parts.append("Earlier in this conversation:\n" + "\n".join(self.summary_lines))
+        known = {key: value for key, value in (case_data or {}).items() if value}
+        if known:
+            parts.append("Case details already collected (don't ask for these again):\n"
+                         + "\n".join(f"- {key}: {value}" for key, value in known.items()))
+        return "\n\n".join(parts)
+
+    def build_messages(self, system_prompt, user_message, case_data=None, budget=None):
+        # The system prompt is identical on every call so the provider can reuse its cached prefix;
+        # everything that changes comes after it, newest turns kept first when the budget is tight
+        budget = budget or CHAT_CONTEXT_TOKENS
+        head = [{"role": "system", "content": system_prompt}]
+        state = self.state_message(case_data)
+        if state:
+            head.append({"role": "system", "content": state})
+        tail = [{"role": "user", "content": user_message}]
+
+        used = count_message_tokens(head + tail)
+        history = []
+        for user, reply in reversed(self.turns):
+            turn = []
+            if user:
+                turn.append({"role": "user", "content": user})
+            if reply:
+                turn.append({"role": "assistant", "content": reply})
+            cost = count_message_tokens(turn)
+            if used + cost > budget:
+                break
+            history[:0] = turn
+            used += cost
+        return head + history + tail
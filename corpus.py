@@ -0,0 +1,323 @@
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import faiss
+import numpy as np
+from metrics import timed
+from rag import embed_query, choose_index_kind, train_index, search_params, rerank
+
+# One shared vector index for every document in the case file, with chunk metadata in SQLite
+CORPUS_DIR = os.getenv("RAG_CORPUS_DIR", os.path.join(tempfile.gettempdir(), "rag_corpus"))
+
+# Exact terms (docket numbers, party names) are matched by a BM25 index kept next to the vectors;
+# both result lists are merged with reciprocal rank fusion
+HYBRID_SEARCH = os.getenv("RAG_HYBRID_SEARCH", "1") == "1"
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+SEARCH_CANDIDATES = int(os.getenv("RAG_SEARCH_CANDIDATES", "30"))
+# Filtered searches over at most this many chunks on an IVF index are done exactly
+EXACT_FILTER_MAX = int(os.getenv("RAG_EXACT_FILTER_MAX", "20000"))
+
+TERM_RE = re.compile(r"\w+")
+
+
+class Corpus:
+    def __init__(self, directory=None):
+        self.directory = directory or CORPUS_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.index_path = os.path.join(self.directory, "corpus.index")
+        self.lock = threading.RLock()
+
+        self.db = sqlite3.connect(os.path.join(self.directory, "corpus.sqlite"), check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                num_chunks INTEGER NOT NULL,
+                added REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                text TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_doc_id ON chunks (doc_id);
+        """)
+        self.lexical = self._create_lexical_index()
+        self.db.commit()
+
+        self.index = faiss.read_index(self.index_path) if os.path.exists(self.index_path) else None
+        self._drop_unfinished()
+
+    def _create_lexical_index(self):
+        exists = self.db.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'").fetchone()
+        try:
+            self.db.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts
+                USING fts5(text, content='chunks', content_rowid='id', tokenize='porter unicode61')
+            """)
+        except sqlite3.OperationalError as e:
+            print("SQLite has no FTS5, falling back to vector-only search:", e)
+            return False
+        if not exists:
+            # Corpora created before the lexical index existed are indexed once here
+            self.db.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+        return True
+
+    def _drop_unfinished(self):
+        # Chunks of a document whose ingestion never reached finish_document (crash, parse error)
+        rows = self.db.execute(
+            "SELECT DISTINCT doc_id FROM chunks WHERE doc_id NOT IN (SELECT doc_id FROM documents)"
+        ).fetchall()
+        for (doc_id,) in rows:
+            self.delete_document(doc_id)
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        faiss.write_index(self.index, tmp_path)
+        os.replace(tmp_path, self.index_path)
+
+    def has_document(self, doc_id):
+        with self.lock:
+            row = self.db.execute("SELECT 1 FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return row is not None
+
+    def documents(self):
+        with self.lock:
+            rows = self.db.execute("SELECT doc_id, name, num_chunks, added FROM documents ORDER BY added").fetchall()
+        return [{"doc_id": r[0], "name": r[1], "num_chunks": r[2], "added": r[3]} for r in rows]
+
+    def document_chunks(self, doc_id):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, page, offset, text FROM chunks WHERE doc_id = ? ORDER BY id", (doc_id,)
+            ).fetchall()
+        return [{"id": r[0], "page": r[1], "offset": r[2], "text": r[3]} for r in rows]
+
+    def _insert_chunks(self, doc_id, records, embeddings):
+        ids = []
+        for record in records:
+            cur = self.db.execute(
+                "INSERT INTO chunks (doc_id, page, offset, text) VALUES (?, ?, ?, ?)",
+                (doc_id, record["page"], record["offset"], record["text"])
+            )
+            ids.append(cur.lastrowid)
+            if self.lexical:
+                self.db.execute("INSERT INTO chunks_fts (rowid, text) VALUES (?, ?)", (cur.lastrowid, record["text"]))
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(embeddings.shape[1]))
+        self.index.add_with_ids(embeddings, np.asarray(ids, dtype=np.int64))
+        return ids
+
+    def add_document(self, doc_id, name, records, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self.lock:
+            if self.has_document(doc_id):
+                return False
+            ids = self._insert_chunks(doc_id, records, embeddings)
+            self.db.execute(
+                "INSERT INTO documents (doc_id, name, num_chunks, added) VALUES (?, ?, ?, ?)",
+                (doc_id, name, len(ids), time.time())
+            )
+            self._save_or_rebuild()
+            self.db.commit()
+        return True
+
+    def add_chunks(self, doc_id, records, embeddings):
+        # Appends one batch of a document still being ingested; it is searchable once finish_document runs
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self.lock:
+            self._insert_chunks(doc_id, records, embeddings)
+            self._save_or_rebuild(save=False)
+            self.db.commit()
+
+    def finish_document(self, doc_id, name):
+        with self.lock:
+            num_chunks = self.db.execute("SELECT COUNT(*) FROM chunks WHERE doc_id = ?", (doc_id,)).fetchone()[0]
+            self.db.execute(
+                "INSERT INTO documents (doc_id, name, num_chunks, added) VALUES (?, ?, ?, ?)",
+                (doc_id, name, num_chunks, time.time())
+            )
+            if self.index is not None:
+                self._save_index()
+            self.db.commit()
+        return num_chunks
+
+    def delete_document(self, doc_id):
+        with self.lock:
+            rows = self.db.execute("SELECT id, text FROM chunks WHERE doc_id = ?", (doc_id,)).fetchall()
+            ids = [r[0] for r in rows]
+            if self.lexical:
+                self.db.executemany("INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', ?, ?)", rows)
+            self.db.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            self.db.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            if ids and self.index is not None:
+                self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+                self._save_or_rebuild()
+            self.db.commit()
+        return len(ids)
+
+    @staticmethod
+    def _target_kind(num_vectors):
+        kind = choose_index_kind(num_vectors)
+        # HNSW cannot remove vectors, which delete_document relies on
+        return "ivf_flat" if kind == "hnsw" else kind
+
+    def _index_kind(self):
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is None:
+            return "flat"
+        return "ivf_pq" if isinstance(ivf, faiss.IndexIVFPQ) else "ivf_flat"
+
+    def _save_or_rebuild(self, save=True):
+        # The index type follows the corpus size: flat while small, IVF once exact search gets slow
+        if self.index.ntotal and self._target_kind(self.index.ntotal) != self._index_kind():
+            self.rebuild_index()
+        elif save:
+            self._save_index()
+
+    def rebuild_index(self, kind="auto"):
+        # Re-trains the index over every stored chunk; the vectors are read back from the current index
+        with self.lock:
+            if self.index is None or self.index.ntotal == 0:
+                return None
+            ids = np.asarray([r[0] for r in self.db.execute("SELECT id FROM chunks ORDER BY id")], dtype=np.int64)
+            embeddings = np.asarray(self.index.reconstruct_batch(ids), dtype=np.float32)
+            if kind == "auto":
+                kind = self._target_kind(len(ids))
+            elif kind == "hnsw":
+                kind = "ivf_flat"
+            index = train_index(embeddings, kind=kind)
+            ivf = faiss.try_extract_index_ivf(index)
+            if ivf is None:
+                index = faiss.IndexIDMap2(index)
+            else:
+                # IVF keeps the chunk ids itself; a hashtable direct map lets it remove and reconstruct by id
+                ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+            index.add_with_ids(embeddings, ids)
+            self.index = index
+            self._save_index()
+        return self._index_kind()
+
+    def _chunk_ids(self, doc_ids):
+        placeholders = ",".join("?" * len(doc_ids))
+        return [r[0] for r in self.db.execute(f"SELECT id FROM chunks WHERE doc_id IN ({placeholders})", doc_ids)]
+
+    def _vector_search(self, query, ids, limit, nprobe=None, ef_search=None):
+        query_embedding = embed_query(query)
+        with self.lock:
+            if self.index is None or self.index.ntotal == 0:
+                return []
+            sel = None
+            if ids is not None:
+                ids = np.asarray(ids, dtype=np.int64)
+                ivf = faiss.try_extract_index_ivf(self.index)
+                if ivf is not None:
+                    # The IVF selector only filters inside the probed lists, so a document whose chunks
+                    # sit in other lists would come back short; search those chunks exactly instead
+                    if len(ids) <= EXACT_FILTER_MAX:
+                        return self._exact_search(query_embedding, ids, limit)
+                    nprobe = ivf.nlist
+                sel = faiss.IDSelectorBatch(ids)
+            params = search_params(self.index, nprobe, ef_search, sel=sel)
+            distances, labels = self.index.search(query_embedding, limit, params=params)
+        return [(int(label), float(distance)) for label, distance in zip(labels[0], distances[0]) if label != -1]
+
+    def _exact_search(self, query_embedding, ids, limit):
+        vectors = self.index.reconstruct_batch(ids)
+        distances = ((vectors - query_embedding) ** 2).sum(axis=1)
+        order = np.argsort(distances)[:limit]
+        return [(int(ids[i]), float(distances[i])) for i in order]
+
+    @timed("lexical_search")
+    def _lexical_search(self, query, doc_ids, limit):
+        terms = TERM_RE.findall(query.lower())
+        if not self.lexical or not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+        sql = """
+            SELECT chunks_fts.rowid, bm25(chunks_fts) FROM chunks_fts
+            JOIN chunks ON chunks.id = chunks_fts.rowid
+            WHERE chunks_fts MATCH ?
+        """
+        args = [match]
+        if doc_ids is not None:
+            sql += f" AND chunks.doc_id IN ({','.join('?' * len(doc_ids))})"
+            args.extend(doc_ids)
+        sql += " ORDER BY bm25(chunks_fts) LIMIT ?"
+        args.append(limit)
+        with self.lock:
+            try:
+                return [(r[0], float(r[1])) for r in self.db.execute(sql, args)]
+            except sqlite3.OperationalError as e:
+                print("Lexical search failed:", e)
+                return []
+
+    @timed("corpus_search")
+    def search(self, query, doc_ids=None, top_k=5, nprobe=None, ef_search=None, hybrid=None):
+        hybrid = HYBRID_SEARCH if hybrid is None else hybrid
+        ids = None
+        if doc_ids is not None:
+            doc_ids = list(doc_ids)
+            if not doc_ids:
+                return []
+            with self.lock:
+                ids = self._chunk_ids(doc_ids)
+            if not ids:
+                return []
+
+        if not hybrid:
+            return self._records(self._vector_search(query, ids, top_k, nprobe, ef_search))
+
+        candidates = max(SEARCH_CANDIDATES, top_k)
+        fused = {}
+        for hits in (self._vector_search(query, ids, candidates, nprobe, ef_search),
+                     self._lexical_search(query, doc_ids, candidates)):
+            for rank, (chunk_id, _) in enumerate(hits):
+                fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+        results = self._records(ranked[:candidates], field="score")
+        scores = rerank(query, [result["text"] for result in results])
+        if scores is not None:
+            for result, score in zip(results, scores):
+                result["score"] = score
+            results.sort(key=lambda result: result["score"], reverse=True)
+        return results[:top_k]
+
+    def _records(self, hits, field="distance"):
+        if not hits:
+            return []
+        placeholders = ",".join("?" * len(hits))
+        with self.lock:
+            rows = self.db.execute(f"""
+                SELECT chunks.id, chunks.doc_id, documents.name, chunks.page, chunks.offset, chunks.text
+                FROM chunks JOIN documents ON documents.doc_id = chunks.doc_id
+                WHERE chunks.id IN ({placeholders})
+            """, [chunk_id for chunk_id, _ in hits]).fetchall()
+        by_id = {r[0]: r for r in rows}
+        results = []
+        for chunk_id, value in hits:
+            if chunk_id in by_id:
+                _, doc_id, name, page, offset, text = by_id[chunk_id]
+                results.append({
+                    "id": chunk_id, "doc_id": doc_id, "name": name, "page": page,
+                    "offset": offset, "text": text, field: value
+                })
+        return results
+
+
+_corpus = None
+_corpus_lock = threading.Lock()
+
+
+def get_corpus():
+    global _corpus
+    with _corpus_lock:
+        if _corpus is None:
+            _corpus = Corpus()
+        return _corpus
@@ -1,16 +1,27 @@
 import streamlit as st
 import os
-import tempfile
-import fitz
 from openai import OpenAI
 from dotenv import load_dotenv
-from docx import Document
-from rag import chunk_text, embed_chunks, save_to_faiss, search_faiss
-import numpy as np 
+from rag import iter_chunks, iter_pages, index_key, prewarm_model, count_tokens, embed_chunks
+from corpus import get_corpus
+from ingest import ingest_files
+from llm_pool import complete
+from metrics import trace, start_exporters
+from summarizer import (
+    map_reduce_summarize, format_level_stats, select_representative, summarize_selected,
+    SUMMARY_CHUNK_TOKENS, SUMMARY_MODE
+)
 
 
 load_dotenv()
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+prewarm_model()
+start_exporters()
+
+# Retrieved chunks are added best-first until the context budget is used up
+FIND_TOP_K = int(os.getenv("FIND_TOP_K", "8"))
+FIND_CONTEXT_TOKENS = int(os.getenv("FIND_CONTEXT_TOKENS", "1200"))
+SUMMARY_ABSTRACTIVE = os.getenv("SUMMARY_ABSTRACTIVE", "1") == "1"
 
 
 st.set_page_config(page_title="Legal Summarizer")
@@ -21,83 +32,50 @@ st.markdown("Upload legal documents (PDF, DOCX, or TXT), and receive a concise s
 uploaded_files = st.file_uploader("Upload files", type=["pdf", "docx", "txt"], accept_multiple_files=True)
 
 
-def extract_text(file):
-    if file.type == "application/pdf":
-        text = ""
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=tempfile.gettempdir()) as tmp:
-            tmp.write(file.read())
-            tmp_path = tmp.name
-
-        try:
-            doc = fitz.open(tmp_path)
-            for page in doc:
-                text += page.get_text()
-            doc.close()
-        except Exception as e:
-            st.warning(f"Error extracting PDF text: {e}")
-            text = None
-
-        os.remove(tmp_path)
-        return text
-
-    elif file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".docx", dir=tempfile.gettempdir()) as tmp:
-            tmp.write(file.read())
-            tmp_path = tmp.name
-
-        try:
-            doc = Document(tmp_path)
-            text = "\n".join(para.text for para in doc.paragraphs)
-        except Exception as e:
-            st.warning(f"Error reading DOCX: {e}")
-            text = None
-
-        os.remove(tmp_path)
-        return text
-
-    elif file.type == "text/plain":
-        return str(file.read(), "utf-8")
-
-    return None
-
-
-def summarize_text(text):
-    if not text or len(text.strip()) < 100:
-        return "No usable content was extracted from the file."
-    
-    chunks = chunk_text(text, chunk_size=1000)
-    max_chunks = 15
-    summaries = []
-
-    for idx, chunk in enumerate(chunks[:max_chunks]):
-        prompt = f"""
-You are a helpful legal assistant. Summarize the following portion of a legal document in clear and concise language.
-Focus on key events, involved parties, dates, and outcomes if mentioned.
-
-Document Chunk {idx+1}:
-\"\"\"{chunk}\"\"\"
-"""
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4-0613",
-                messages=[{"role":"user","content": prompt}],
-                temperature=0.3,
-                timeout=60
-            )
-            summaries.append(response.choices[0].message.content.strip())
-        except Exception as e:
-            summaries.append(f"Failed to summarize chunk {idx+1}: {e}")
-            break
+def summary_chunks(file):
+    # Pages are chunked as they are extracted; the whole document is never joined into one string
+    try:
+        return list(iter_chunks(iter_pages(file.getvalue(), file.type), SUMMARY_CHUNK_TOKENS, 0))
+    except Exception as e:
+        st.warning(f"Error extracting text from {file.name}: {e}")
+        return []
+
 
-    return "\n\n".join(summaries)  
+def summarize_chunks(chunks):
+    if sum(len(chunk.strip()) for chunk in chunks) < 100:
+        return "No usable content was extracted from the file.", []
+    return map_reduce_summarize(client, chunks, model="gpt-4-0613")
 
 
-def find_answer(question, file_name):
-    base_name = os.path.splitext(file_name)[0]
-    temp_index_path = os.path.join(tempfile.gettempdir(), base_name)
+def select_passages(doc_id):
+    # The chunks were embedded at ingest, so this is an embedding-cache read plus a NumPy pass
+    records = get_corpus().document_chunks(doc_id)
+    if not records:
+        return []
+    selected = select_representative(embed_chunks([record["text"] for record in records]))
+    return [records[i] for i in selected]
 
-    top_chunks = search_faiss(question, faiss_path=temp_index_path)
-    context = "\n\n".join(top_chunks)
+
+def format_passages(passages):
+    lines = []
+    for passage in passages:
+        text = passage["text"] if len(passage["text"]) <= 300 else passage["text"][:300].rsplit(" ", 1)[0] + " …"
+        lines.append(f"- *(page {passage['page']})* {text}")
+    return "\n".join(lines)
+
+
+def find_answer(question, doc_ids=None):
+    # doc_ids limits the search to these documents; callers pass the current session's uploads
+    hits = get_corpus().search(question, doc_ids=doc_ids, top_k=FIND_TOP_K)
+    blocks, used = [], 0
+    for hit in hits:
+        block = f"[{hit['name']}, page {hit['page']}]\n{hit['text']}"
+        tokens = count_tokens(block)
+        if blocks and used + tokens > FIND_CONTEXT_TOKENS:
+            break
+        blocks.append(block)
+        used += tokens
+    context = "\n\n".join(blocks)
 
     prompt = f"""
 You are a legal assistant. Use the context below to answer the user's question.
@@ -110,49 +88,77 @@ Question:
 
 Answer clearly and concisely using only the document contents.
 """
-    response = client.chat.completions.create(
-        model="gpt-4-0613",
-        messages=[{"role":"user","content":prompt}],
-        temperature=0.3
-    )
+    response = complete(client, prompt, model="gpt-4-0613", temperature=0.3)
     return response.choices[0].message.content.strip()
 
 
 if uploaded_files:
     summary_blocks = []
+    corpus = get_corpus()
+    doc_ids = {}
+    to_ingest = []
 
     for file in uploaded_files:
-        block = f"**File: {file.name}**\n\n"
+        doc_ids[file.name] = index_key(file.getvalue())
+        if not corpus.has_document(doc_ids[file.name]):
+            to_ingest.append({"name": file.name, "type": file.type, "bytes": file.getvalue(), "doc_id": doc_ids[file.name]})
+
+    if to_ingest:
+        progress = st.progress(0.0, text=f"Indexing {len(to_ingest)} file(s)...")
+        done = []
+
+        def on_progress(name, stage, detail=None):
+            if stage in ("indexed", "empty", "failed"):
+                done.append(name)
+            progress.progress(len(done) / len(to_ingest), text=f"{name}: {stage}")
+
+        results = ingest_files(to_ingest, on_progress=on_progress, corpus=corpus)
+        progress.empty()
 
-        with st.spinner(f"Extracting content from {file.name}..."):
-            text = extract_text(file)
-            if not text:
-                block += "Could not extract text from this file. \n---"
-                summary_blocks.append(block)
-                continue
+        for item in to_ingest:
+            result = results.get(item["name"])
+            if isinstance(result, Exception):
+                st.warning(f"Error extracting text from {item['name']}: {result}")
 
-        with st.spinner("Preparing for question answering..."):
-            chunks = chunk_text(text)
-            embeddings = embed_chunks(chunks)
-            base_name = os.path.splitext(file.name)[0]
-            temp_index_path = os.path.join(tempfile.gettempdir(), base_name)
-            save_to_faiss(chunks, np.array(embeddings), faiss_path=temp_index_path)
+    for file in uploaded_files:
+        block = f"**File: {file.name}**\n\n"
+        doc_id = doc_ids[file.name]
+
+        if not corpus.has_document(doc_id):
+            block += "Could not extract text from this file. \n---"
+            summary_blocks.append(block)
+            continue
 
         action = st.radio(f"What would you like to do with **{file.name}**?", ["Summarize", "Find Something"], key=file.name)
 
         if action == "Summarize":
             if st.button(f"Summarize {file.name}"):
-                with st.spinner("Summarizing..."):
-                    summary = summarize_text(text)
-                    block += summary.replace("\n", " \n") + "\n\n---"
+                with trace("summarize", mode=SUMMARY_MODE):
+                    if SUMMARY_MODE == "extractive":
+                        passages = select_passages(doc_id)
+                        preview = st.empty()
+                        preview.markdown(f"**Key passages from {file.name}:**\n\n" + format_passages(passages))
+                        if SUMMARY_ABSTRACTIVE and passages:
+                            with st.spinner("Summarizing..."):
+                                summary, levels = summarize_selected(client, [p["text"] for p in passages], model="gpt-4-0613")
+                            preview.empty()
+                        else:
+                            summary, levels = format_passages(passages), []
+                    else:
+                        with st.spinner("Summarizing..."):
+                            summary, levels = summarize_chunks(summary_chunks(file))
+                    block += summary.replace("\n", " \n") + "\n\n"
+                    if levels:
+                        block += "*" + " | ".join(format_level_stats(levels)) + "*\n\n"
+                    block += "---"
                     summary_blocks.append(block)
 
         elif action == "Find Something":
             user_question = st.text_input(f"Enter your question about {file.name}:", key=f"question_{file.name}")
             if st.button(f"Find answer in {file.name}"):
                 if user_question.strip():
-                    with st.spinner("Searching..."):
-                        answer = find_answer(user_question, file.name)
+                    with st.spinner("Searching..."), trace("find_answer"):
+                        answer = find_answer(user_question, doc_ids=[doc_id])
                         block += f"**Question:** {user_question} \n\n"
                         block += answer + "\n\n----"
                         summary_blocks.append(block)
@@ -160,5 +166,20 @@ if uploaded_files:
                     block += "Please enter a question before clicking. \n---"
                     summary_blocks.append(block)
 
+    indexed_names = [name for name, doc_id in doc_ids.items() if corpus.has_document(doc_id)]
+    if len(indexed_names) > 1:
+        st.markdown("---")
+        selected = st.multiselect("Search across documents (leave empty for all of your uploaded files):", indexed_names, default=indexed_names)
+        cross_question = st.text_input("Enter your question across documents:", key="question_all")
+        if st.button("Find answer across documents"):
+            if cross_question.strip():
+                # The corpus is shared by every session, so the search is always limited to this session's files
+                searched = selected or indexed_names
+                with st.spinner("Searching..."), trace("find_answer", documents=len(searched)):
+                    answer = find_answer(cross_question, doc_ids=[doc_ids[name] for name in searched])
+                    summary_blocks.append(f"**Documents: {', '.join(selected) or 'all uploaded files'}**\n\n**Question:** {cross_question} \n\n" + answer + "\n\n----")
+            else:
+                summary_blocks.append("Please enter a question before clicking. \n---")
+
     for block in reversed(summary_blocks):
         st.markdown(block)
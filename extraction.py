@@ -0,0 +1,186 @@
+# Kept free of model/FAISS imports so ingestion worker processes start quickly
+import io
+import os
+import re
+import threading
+from collections import deque
+import fitz
+from docx import Document
+
+PDF_MIME = "application/pdf"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TXT_MIME = "text/plain"
+
+MAX_PAGES = 1000
+DOCX_PARAGRAPHS_PER_PAGE = 50
+
+# Chunk sizes are in model tokens; all-MiniLM-L6-v2 truncates anything past 256
+CHUNK_TOKENS = int(os.getenv("RAG_CHUNK_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("RAG_CHUNK_OVERLAP_TOKENS", "30"))
+TOKENIZER_NAME = os.getenv("RAG_TOKENIZER", "sentence-transformers/all-MiniLM-L6-v2")
+
+# Without the `tokenizers` package (or offline), words are counted in pieces of up to 6 characters,
+# which slightly overestimates WordPiece counts for English
+APPROX_TOKEN_RE = re.compile(r"\w{1,6}|[^\w\s]")
+SENTENCE_END_RE = re.compile(r"[.!?;:][\"')\]]*\s+")
+
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+
+def iter_pages(file_bytes, file_type, max_pages=None):
+    if file_type == PDF_MIME:
+        doc = fitz.open(stream=file_bytes, filetype="pdf")
+        try:
+            page_count = len(doc) if max_pages is None else min(len(doc), max_pages)
+            for i in range(page_count):
+                yield doc[i].get_text()
+        finally:
+            doc.close()
+
+    elif file_type == DOCX_MIME:
+        # DOCX has no real pages, so paragraphs are grouped into fixed-size blocks
+        paragraphs = [para.text for para in Document(io.BytesIO(file_bytes)).paragraphs]
+        for i in range(0, len(paragraphs), DOCX_PARAGRAPHS_PER_PAGE):
+            block = "\n".join(paragraphs[i:i + DOCX_PARAGRAPHS_PER_PAGE])
+            yield block if i + DOCX_PARAGRAPHS_PER_PAGE >= len(paragraphs) else block + "\n"
+
+    elif file_type == TXT_MIME:
+        yield str(file_bytes, "utf-8")
+
+
+# Used in review_app.py (Streamlit)
+def extract_text(file):
+    return "".join(iter_pages(file.getvalue(), file.type, max_pages=MAX_PAGES))
+
+
+def _hub_offline():
+    return any(os.getenv(name, "").lower() in ("1", "true", "yes") for name in ("HF_HUB_OFFLINE", "TRANSFORMERS_OFFLINE"))
+
+
+def _load_tokenizer():
+    global _tokenizer, _tokenizer_loaded
+    with _tokenizer_lock:
+        if not _tokenizer_loaded:
+            _tokenizer_loaded = True
+            try:
+                from tokenizers import Tokenizer
+                local_path = os.path.join(os.getenv("RAG_MODEL_PATH", ""), "tokenizer.json")
+                if os.path.isfile(local_path):
+                    _tokenizer = Tokenizer.from_file(local_path)
+                elif os.path.isfile(TOKENIZER_NAME):
+                    _tokenizer = Tokenizer.from_file(TOKENIZER_NAME)
+                elif _hub_offline():
+                    # Only a cached copy; an unreachable hub would otherwise cost ~20s of retries per process
+                    from huggingface_hub import hf_hub_download
+                    _tokenizer = Tokenizer.from_file(hf_hub_download(TOKENIZER_NAME, "tokenizer.json", local_files_only=True))
+                else:
+                    _tokenizer = Tokenizer.from_pretrained(TOKENIZER_NAME)
+                # The model's tokenizer.json truncates/pads to 128; offsets must cover the whole text
+                _tokenizer.no_truncation()
+                _tokenizer.no_padding()
+            except Exception as e:
+                print("Tokenizer unavailable, approximating token counts:", e)
+    return _tokenizer
+
+
+def token_spans(text):
+    # (start, end) character offsets of each model token in text
+    tokenizer = _tokenizer if _tokenizer_loaded else _load_tokenizer()
+    if tokenizer is None:
+        return [match.span() for match in APPROX_TOKEN_RE.finditer(text)]
+    return tokenizer.encode(text, add_special_tokens=False).offsets
+
+
+def count_tokens(text):
+    return len(token_spans(text))
+
+
+def _iter_paragraphs(pages):
+    # Yields (paragraph, page number, character offset into the whole document)
+    pending, pending_page, pending_offset = "", 1, 0
+    for page_no, page_text in enumerate(pages, 1):
+        if not pending:
+            pending_page = page_no
+        pending += page_text
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line, pending_page, pending_offset
+            pending_offset += len(line) + 1
+            pending_page = page_no
+    yield pending, pending_page, pending_offset
+
+
+def _split_span(spans, first, last, chunk_tokens):
+    for i in range(first, last, chunk_tokens):
+        j = min(i + chunk_tokens, last)
+        yield spans[i][0], spans[j - 1][1], j - i
+
+
+def _iter_units(paragraph, chunk_tokens):
+    # Sentence-sized (start, end, tokens) spans of a paragraph; sentences over chunk_tokens are hard-split
+    spans = token_spans(paragraph)
+    if not spans:
+        return
+    boundaries = [match.end() for match in SENTENCE_END_RE.finditer(paragraph)] + [len(paragraph)]
+    sentence, first = 0, 0
+    for i, (start, _) in enumerate(spans):
+        while start >= boundaries[sentence]:
+            if i > first:
+                yield from _split_span(spans, first, i, chunk_tokens)
+                first = i
+            sentence += 1
+    yield from _split_span(spans, first, len(spans), chunk_tokens)
+
+
+def _chunk_record(window, tokens):
+    return {
+        "text": " ".join(unit[0] for unit in window),
+        "page": window[0][1],
+        "offset": window[0][2],
+        "end": window[-1][3],
+        "tokens": tokens
+    }
+
+
+def iter_chunk_records(pages, chunk_tokens=None, overlap_tokens=None):
+    # Greedily packs sentences into chunks of at most chunk_tokens, repeating up to overlap_tokens of
+    # trailing sentences at the start of the next chunk; offsets are character positions in the document
+    chunk_tokens = chunk_tokens or CHUNK_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+
+    window, total, fresh = deque(), 0, 0
+    for para, page, offset in _iter_paragraphs(pages):
+        for start, end, tokens in _iter_units(para, chunk_tokens):
+            if fresh and total + tokens > chunk_tokens:
+                yield _chunk_record(window, total)
+                kept, kept_tokens = deque(), 0
+                while window and kept_tokens + window[-1][4] <= overlap_tokens:
+                    unit = window.pop()
+                    kept.appendleft(unit)
+                    kept_tokens += unit[4]
+                window, total, fresh = kept, kept_tokens, 0
+            while window and total + tokens > chunk_tokens:
+                total -= window.popleft()[4]
+            window.append((para[start:end], page, offset + start, offset + end, tokens))
+            total += tokens
+            fresh += tokens
+    if fresh:
+        yield _chunk_record(window, total)
+
+
+def iter_chunks(pages, chunk_tokens=None, overlap_tokens=None):
+    for record in iter_chunk_records(pages, chunk_tokens, overlap_tokens):
+        yield record["text"]
+
+
+def chunk_text(text, chunk_tokens=None, overlap_tokens=None):
+    return list(iter_chunks([text], chunk_tokens, overlap_tokens))
+
+
+# Runs inside ingestion worker processes
+def parse_file(file_bytes, file_type, chunk_tokens=None, overlap_tokens=None):
+    return list(iter_chunk_records(iter_pages(file_bytes, file_type), chunk_tokens, overlap_tokens))
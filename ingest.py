@@ -0,0 +1,130 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from extraction import parse_file, iter_pages, iter_chunk_records
+from metrics import timed
+from rag import embed_chunks
+from corpus import get_corpus
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 2)))
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "256"))
+# Files larger than this are chunked in this process as a stream instead of whole in a pool worker
+INGEST_STREAM_BYTES = int(os.getenv("INGEST_STREAM_BYTES", str(4 * 1024 * 1024)))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking would copy the Streamlit process, its threads and the loaded embedding model
+            _pool = ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+@timed("ingest_files")
+def ingest_files(files, chunk_tokens=None, on_progress=None, corpus=None, overlap_tokens=None):
+    # files: list of {"name", "type", "bytes", "doc_id"}; returns {name: chunk count or Exception}
+    # Chunks are embedded and written to the corpus INGEST_EMBED_BATCH at a time, so memory is bounded
+    # by the batch size and the largest pooled file rather than by the whole upload
+    corpus = corpus or get_corpus()
+    def report(name, stage, detail=None):
+        if on_progress:
+            on_progress(name, stage, detail)
+
+    results = {}
+    counts = {}
+    parsed = []
+    pending = []
+
+    def flush(force=False):
+        while pending and (force or len(pending) >= INGEST_EMBED_BATCH):
+            batch = pending[:INGEST_EMBED_BATCH]
+            del pending[:INGEST_EMBED_BATCH]
+            vectors = embed_chunks([record["text"] for _, record in batch])
+            for idx in dict.fromkeys(idx for idx, _ in batch):
+                rows = [i for i, (owner, _) in enumerate(batch) if owner == idx]
+                corpus.add_chunks(files[idx]["doc_id"], [batch[i][1] for i in rows], vectors[rows])
+
+    def add(idx, records):
+        for record in records:
+            pending.append((idx, record))
+            counts[idx] += 1
+            flush()
+
+    def fail(idx, error):
+        pending[:] = [item for item in pending if item[0] != idx]
+        corpus.delete_document(files[idx]["doc_id"])
+        results[files[idx]["name"]] = error
+        report(files[idx]["name"], "failed", error)
+
+    def done_parsing(idx):
+        parsed.append(idx)
+        report(files[idx]["name"], "parsed", counts[idx])
+
+    streamed, pooled, seen = [], [], set()
+    for idx, f in enumerate(files):
+        # Already indexed, or the same content twice in this upload
+        if f["doc_id"] in seen or corpus.has_document(f["doc_id"]):
+            continue
+        seen.add(f["doc_id"])
+        counts[idx] = 0
+        if len(files) == 1 or len(f["bytes"]) > INGEST_STREAM_BYTES:
+            streamed.append(idx)
+        else:
+            pooled.append(idx)
+
+    futures = {}
+    if pooled:
+        pool = _get_pool()
+        futures = {
+            pool.submit(parse_file, files[idx]["bytes"], files[idx]["type"], chunk_tokens, overlap_tokens): idx
+            for idx in pooled
+        }
+
+    def collect(future):
+        idx = futures.pop(future)
+        try:
+            records = future.result()
+        except Exception as e:
+            fail(idx, e)
+            return
+        add(idx, records)
+        done_parsing(idx)
+
+    # Large files are chunked lazily here, so embedding starts before their extraction finishes;
+    # small files parsed by the pool meanwhile join the same embedding batches
+    for idx in streamed:
+        records = iter_chunk_records(iter_pages(files[idx]["bytes"], files[idx]["type"]), chunk_tokens, overlap_tokens)
+        while True:
+            try:
+                record = next(records, None)
+            except Exception as e:
+                fail(idx, e)
+                break
+            if record is None:
+                done_parsing(idx)
+                break
+            add(idx, [record])
+            if counts[idx] % INGEST_EMBED_BATCH == 0:
+                for future in [future for future in futures if future.done()]:
+                    collect(future)
+
+    for future in as_completed(list(futures)):
+        collect(future)
+    flush(force=True)
+
+    for idx in parsed:
+        name = files[idx]["name"]
+        if not counts[idx]:
+            results[name] = 0
+            report(name, "empty")
+            continue
+        corpus.finish_document(files[idx]["doc_id"], name)
+        results[name] = counts[idx]
+        report(name, "indexed", counts[idx])
+
+    return results
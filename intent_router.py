@@ -0,0 +1,123 @@
+import os
+import re
+import random
+import threading
+import numpy as np
+from metrics import count
+
+# Turns routed here get an instant templated reply instead of a GPT-4 call
+INTENT_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", "0.75"))
+INTENT_MAX_WORDS = 8
+
+LEGAL_KEYWORDS = ["should", "can i", "do i have", "is it legal", "sue", "lawsuit", "claim", "liable", "why"]
+
+CASUAL_INPUTS = [
+    "hi", "hello", "hey", "how are you", "good morning", "good evening",
+    "what's up", "sup", "yo", "how’s it going", "how r u"
+]
+
+PROTOTYPES = {
+    "greeting": CASUAL_INPUTS + ["hey there", "hello there", "hi jed", "good afternoon", "howdy", "hiya"],
+    "thanks": ["thanks", "thank you", "thank you so much", "appreciate it", "thanks a lot", "ok thanks"],
+    "contact_request": [
+        "can i speak to someone", "i want to talk to a lawyer", "let me talk to a real person",
+        "how do i contact you", "is there a human i can talk to", "what is your phone number"
+    ],
+    "incident": [
+        "i got into an accident", "i was hit by a car", "i slipped and fell", "my landlord won't fix the mold",
+        "i was hurt at work", "someone rear ended me"
+    ],
+    "legal_question": [
+        "can i sue my landlord", "is it legal to fire me for this", "do i have a case",
+        "how long do i have to file a claim", "who is liable for my injuries"
+    ]
+}
+
+TEMPLATES = {
+    "greeting": [
+        "Hi there! I’m Jed.ai. I’m here to help — would you like to tell me what happened?",
+        "Hello! Thanks for reaching out. Whenever you’re ready, tell me a little about what happened.",
+        "I’m here and ready to help you—thanks for asking! Would you like to tell me what happened?"
+    ],
+    "thanks": [
+        "You’re very welcome. Is there anything else I can help you with?",
+        "Happy to help! Let me know if there’s anything else on your mind."
+    ],
+    "contact_request": [
+        "You can reach our intake team at **sidgajraj@gmail.com** or call us at **(xxx) xxx-xxxx**. I’m here if you’d like to talk now."
+    ]
+}
+
+_prototype_matrix = None
+_prototype_labels = None
+_prototype_lock = threading.Lock()
+
+_stats = {"total": 0, "local": 0, "llm": 0, "by_intent": {}}
+_stats_lock = threading.Lock()
+
+
+def normalize(text):
+    text = text.lower().strip()
+    text = re.sub(r"[!?.,]+$", "", text)
+    return re.sub(r"\s+", " ", text)
+
+
+def _prototypes():
+    # The MiniLM model already loaded for document search doubles as the intent encoder
+    global _prototype_matrix, _prototype_labels
+    from rag import embed_normalized
+    with _prototype_lock:
+        if _prototype_matrix is None:
+            labels, texts = [], []
+            for intent, examples in PROTOTYPES.items():
+                labels.extend([intent] * len(examples))
+                texts.extend(examples)
+            _prototype_matrix = embed_normalized(texts)
+            _prototype_labels = labels
+        return _prototype_matrix, _prototype_labels
+
+
+def classify_intent(user_input, allow_fuzzy=True):
+    text = normalize(user_input)
+    if any(kw in text for kw in LEGAL_KEYWORDS):
+        return "legal_question", 1.0
+    if text in CASUAL_INPUTS:
+        return "greeting", 1.0
+    if not allow_fuzzy or not text or len(text.split()) > INTENT_MAX_WORDS:
+        return "other", 0.0
+
+    try:
+        from rag import embed_normalized
+        matrix, labels = _prototypes()
+        scores = matrix @ embed_normalized([text])[0]
+    except Exception as e:
+        # Without the embedding model the turn still goes to the LLM
+        print("Intent model unavailable:", e)
+        return "other", 0.0
+    best = int(np.argmax(scores))
+    return labels[best], float(scores[best])
+
+
+def _count(intent, local):
+    count("intent_routes_total", intent=intent, path="local" if local else "llm")
+    with _stats_lock:
+        _stats["total"] += 1
+        _stats["local" if local else "llm"] += 1
+        _stats["by_intent"][intent] = _stats["by_intent"].get(intent, 0) + 1
+
+
+def route_intent(user_input, allow_fuzzy=True):
+    # Returns (intent, confidence, templated reply or None when the LLM is needed)
+    intent, confidence = classify_intent(user_input, allow_fuzzy=allow_fuzzy)
+    if intent in TEMPLATES and confidence >= INTENT_THRESHOLD:
+        _count(intent, local=True)
+        return intent, confidence, random.choice(TEMPLATES[intent])
+    _count(intent, local=False)
+    return intent, confidence, None
+
+
+def router_stats():
+    with _stats_lock:
+        stats = dict(_stats, by_intent=dict(_stats["by_intent"]))
+    stats["hit_rate"] = stats["local"] / stats["total"] if stats["total"] else 0.0
+    return stats
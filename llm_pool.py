@@ -0,0 +1,122 @@
+import os
+import random
+import threading
+import time
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+from metrics import span, count, record_llm_usage
+
+# Point OPENAI_BASE_URL at a local stub of /v1/chat/completions to exercise this without the real API
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "6"))
+LLM_RPM = int(os.getenv("LLM_RPM", "200"))
+LLM_TPM = int(os.getenv("LLM_TPM", "40000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "400"))
+
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class RateLimiter:
+    def __init__(self, rpm, tpm, window=60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self.calls = deque()
+        self.lock = threading.Lock()
+
+    def _prune(self, now):
+        while self.calls and now - self.calls[0][0] >= self.window:
+            self.calls.popleft()
+
+    def acquire(self, tokens):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._prune(now)
+                used_tokens = sum(call[1] for call in self.calls)
+                under_rpm = len(self.calls) < self.rpm
+                under_tpm = used_tokens + tokens <= self.tpm or not self.calls
+                if under_rpm and under_tpm:
+                    call = [now, tokens]
+                    self.calls.append(call)
+                    return call
+                wait = self.window - (now - self.calls[0][0])
+            time.sleep(max(wait, 0.05))
+
+    def settle(self, call, actual_tokens):
+        with self.lock:
+            call[1] = actual_tokens
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model, rpm=None, tpm=None):
+    with _limiters_lock:
+        if model not in _limiters:
+            _limiters[model] = RateLimiter(rpm or LLM_RPM, tpm or LLM_TPM)
+        return _limiters[model]
+
+
+def _retry_after(error, attempt):
+    response = getattr(error, "response", None)
+    if response is not None:
+        header = response.headers.get("retry-after")
+        if header:
+            try:
+                return float(header)
+            except ValueError:
+                pass
+    return min(60.0, (2 ** attempt) + random.uniform(0, 1))
+
+
+def complete(client, prompt, model="gpt-4-0613", temperature=0.3, timeout=60, limiter=None, max_retries=None):
+    limiter = limiter or get_rate_limiter(model)
+    max_retries = LLM_MAX_RETRIES if max_retries is None else max_retries
+    estimated = estimate_tokens(prompt) + LLM_EXPECTED_COMPLETION_TOKENS
+
+    for attempt in range(max_retries + 1):
+        call = limiter.acquire(estimated)
+        try:
+            with span("llm_call", model=model):
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature,
+                    timeout=timeout
+                )
+        except RETRYABLE_ERRORS as e:
+            count("llm_retries_total", model=model, error=type(e).__name__)
+            if attempt == max_retries:
+                raise
+            time.sleep(_retry_after(e, attempt))
+            continue
+
+        usage = getattr(response, "usage", None)
+        if usage is not None and usage.total_tokens:
+            limiter.settle(call, usage.total_tokens)
+            record_llm_usage(model, usage.prompt_tokens, usage.completion_tokens)
+        return response
+
+
+def complete_many(client, prompts, model="gpt-4-0613", temperature=0.3, timeout=60, max_workers=None):
+    def run(prompt):
+        try:
+            return complete(client, prompt, model=model, temperature=temperature, timeout=timeout)
+        except Exception as e:
+            return e
+
+    if not prompts:
+        return []
+    workers = min(max_workers or LLM_MAX_WORKERS, len(prompts))
+    # Each call runs in a copy of the caller's context so its spans land on the caller's trace
+    contexts = [contextvars.copy_context() for _ in prompts]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda ctx, prompt: ctx.run(run, prompt), contexts, prompts))
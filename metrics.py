@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stage timings, token/cost counters and per-turn traces; with METRICS_ENABLED=0 every hook is a no-op
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Prometheus text on http://host:METRICS_PORT/metrics, recent traces on /traces (0 = no server)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_DUMP_PATH = os.getenv("METRICS_DUMP_PATH", "")
+METRICS_DUMP_INTERVAL = float(os.getenv("METRICS_DUMP_INTERVAL", "60"))
+METRICS_TRACE_BUFFER = int(os.getenv("METRICS_TRACE_BUFFER", "200"))
+# Finished traces are also appended here as JSON lines
+METRICS_TRACE_LOG = os.getenv("METRICS_TRACE_LOG", "")
+METRIC_PREFIX = "jedai"
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# USD per 1K tokens (prompt, completion)
+MODEL_PRICES = {
+    "gpt-4-0613": (0.03, 0.06),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015)
+}
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_traces = deque(maxlen=METRICS_TRACE_BUFFER)
+_current_trace = contextvars.ContextVar("metrics_trace", default=None)
+_current_span = contextvars.ContextVar("metrics_span", default=None)
+_exporters_started = False
+_NOOP = nullcontext()
+
+
+def observe(stage, seconds):
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        hist = _histograms.get(stage)
+        if hist is None:
+            hist = _histograms[stage] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist["buckets"][i] += 1
+                break
+        hist["sum"] += seconds
+        hist["count"] += 1
+
+
+def count(name, value=1, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def annotate(**attrs):
+    # Attaches attributes (token counts, hit/miss, sizes) to the innermost open span
+    current = _current_span.get() if METRICS_ENABLED else None
+    if current is not None:
+        current["attrs"].update(attrs)
+
+
+@contextmanager
+def _span(stage, attrs):
+    record = {"name": stage, "attrs": attrs}
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        _current_span.reset(token)
+        observe(stage, seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            record["offset_ms"] = round((started - trace["_started"]) * 1000, 2)
+            record["duration_ms"] = round(seconds * 1000, 2)
+            trace["spans"].append(record)
+
+
+def span(stage, **attrs):
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _span(stage, attrs)
+
+
+def timed(stage):
+    def decorator(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _span(stage, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def _trace(name, attrs):
+    trace = {"id": uuid.uuid4().hex[:16], "name": name, "attrs": attrs, "spans": [],
+             "timestamp": time.time(), "_started": time.perf_counter()}
+    token = _current_trace.set(trace)
+    try:
+        with _span(name, attrs):
+            yield
+    finally:
+        _current_trace.reset(token)
+        trace.pop("_started")
+        trace["duration_ms"] = trace["spans"][-1]["duration_ms"] if trace["spans"] else None
+        with _lock:
+            _traces.append(trace)
+        if METRICS_TRACE_LOG:
+            try:
+                with open(METRICS_TRACE_LOG, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace) + "\n")
+            except OSError as e:
+                print("Could not write trace:", e)
+
+
+def trace(name, **attrs):
+    # One trace per user turn; spans opened inside it (on the same thread) are recorded on it
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _trace(name, attrs)
+
+
+def record_llm_usage(model, prompt_tokens, completion_tokens):
+    if not METRICS_ENABLED:
+        return
+    count("llm_tokens_total", prompt_tokens, model=model, kind="prompt")
+    count("llm_tokens_total", completion_tokens, model=model, kind="completion")
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    count("llm_cost_usd_total", (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000, model=model)
+    annotate(model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+def record_cache(cache, hit, amount=1):
+    count("cache_events_total", amount, cache=cache, result="hit" if hit else "miss")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{str(value)}"' for key, value in pairs) + "}"
+
+
+def render_prometheus():
+    with _lock:
+        histograms = {stage: dict(hist, buckets=list(hist["buckets"])) for stage, hist in _histograms.items()}
+        counters = dict(_counters)
+
+    name = f"{METRIC_PREFIX}_stage_seconds"
+    lines = [f"# TYPE {name} histogram"]
+    for stage, hist in sorted(histograms.items()):
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS, hist["buckets"]):
+            cumulative += bucket
+            lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {hist["count"]}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {hist["sum"]:.6f}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {hist["count"]}')
+
+    typed = set()
+    for (counter, labels), value in sorted(counters.items()):
+        full_name = f"{METRIC_PREFIX}_{counter}"
+        if full_name not in typed:
+            lines.append(f"# TYPE {full_name} counter")
+            typed.add(full_name)
+        lines.append(f"{full_name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot(traces=20):
+    with _lock:
+        stages = {
+            stage: {
+                "count": hist["count"],
+                "mean_ms": round(1000 * hist["sum"] / hist["count"], 2) if hist["count"] else None,
+                "buckets": dict(zip([str(b) for b in BUCKETS], hist["buckets"]))
+            }
+            for stage, hist in _histograms.items()
+        }
+        counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in _counters.items()]
+        recent = list(_traces)[-traces:] if traces else []
+    return {"timestamp": time.time(), "stages": stages, "counters": counters, "traces": recent}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics"):
+            body, content_type = render_prometheus(), "text/plain; version=0.0.4"
+        elif self.path.startswith("/traces"):
+            body, content_type = json.dumps(snapshot(traces=METRICS_TRACE_BUFFER)["traces"]), "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _dump_loop():
+    while True:
+        time.sleep(METRICS_DUMP_INTERVAL)
+        tmp_path = METRICS_DUMP_PATH + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot(), f)
+            os.replace(tmp_path, METRICS_DUMP_PATH)
+        except OSError as e:
+            print("Could not write metrics dump:", e)
+
+
+def start_exporters():
+    # Safe to call on every Streamlit rerun; the server and dump thread start once per process
+    global _exporters_started
+    with _lock:
+        if _exporters_started or not METRICS_ENABLED:
+            return
+        _exporters_started = True
+    if METRICS_PORT:
+        try:
+            server = ThreadingHTTPServer(("0.0.0.0", METRICS_PORT), _MetricsHandler)
+            threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        except OSError as e:
+            print(f"Could not start metrics server on port {METRICS_PORT}:", e)
+    if METRICS_DUMP_PATH:
+        threading.Thread(target=_dump_loop, name="metrics-dump", daemon=True).start()
@@ -1,75 +1,326 @@
-import os
-import faiss
-import pickle
-import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.feature_extraction.text import TfidfVectorizer
-import fitz
-from docx import Document
-import tempfile
-
-model = SentenceTransformer('all-MiniLM-L6-v2')
-
-# Used in review_app.py (Streamlit)
-def extract_text(file):
-    if file.type == "application/pdf":
-        text = ""
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(file.read())
-            tmp_path = tmp.name
-
-        doc = fitz.open(tmp_path)
-        max_pages = 1000
-        for i in range(min(len(doc), max_pages)):
-            text += doc[i].get_text()
-        doc.close()
-        os.remove(tmp_path)
-        return text
-
-    elif file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp:
-            tmp.write(file.read())
-            tmp_path = tmp.name
-
-        doc = Document(tmp_path)
-        text = "\n".join(para.text for para in doc.paragraphs)
-        os.remove(tmp_path)
-        return text
-
-    elif file.type == "text/plain":
-        return str(file.read(), "utf-8")
-
-    return ""
-
-def chunk_text(text, chunk_size=500):
-    paragraphs = text.split("\n")
-    chunks, current = [], ""
-    for para in paragraphs:
-        if len(current) + len(para) <= chunk_size:
-            current += " " + para
-        else:
-            chunks.append(current.strip())
-            current = para
-    if current:
-        chunks.append(current.strip())
-    return chunks
-
-def embed_chunks(chunks):
-    return model.encode(chunks, show_progress_bar=False)
-
-def save_to_faiss(chunks, embeddings, faiss_path):
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)
-    faiss.write_index(index, faiss_path + ".index")
-    with open(faiss_path + "_chunks.pkl", "wb") as f:
-        pickle.dump(chunks, f)
-
-def search_faiss(query, faiss_path, top_k=5):
-    index = faiss.read_index(faiss_path + ".index")
-    with open(faiss_path + "_chunks.pkl", "rb") as f:
-        chunks = pickle.load(f)
-
-    query_embedding = model.encode([query])
-    _, I = index.search(query_embedding, top_k)
-    return [chunks[i] for i in I[0]]
-
+import os
+import faiss
+import pickle
+import numpy as np
+import tempfile
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from metrics import timed, record_cache
+from extraction import (
+    iter_pages, extract_text, iter_chunk_records, iter_chunks, chunk_text, count_tokens,
+    CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+)
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+# Optional local copy of the model (e.g. an ONNX export or quantized weights) and the backend to run it with
+MODEL_PATH = os.getenv("RAG_MODEL_PATH")
+MODEL_BACKEND = os.getenv("RAG_MODEL_BACKEND", "torch")
+MODEL_FILE = os.getenv("RAG_MODEL_FILE")
+MODEL_PREWARM = os.getenv("RAG_PREWARM", "1") == "1"
+# Embeddings from a different backend or weights are cached separately
+MODEL_ID = MODEL_NAME if not (MODEL_PATH or MODEL_FILE or MODEL_BACKEND != "torch") else f"{MODEL_PATH or MODEL_NAME}:{MODEL_BACKEND}:{MODEL_FILE or ''}"
+
+# The model is loaded on first use (torch alone takes seconds to import) and shared by every session
+_model = None
+_model_lock = threading.Lock()
+# A failed load is raised again for this long instead of being retried on every chat turn
+MODEL_RETRY_SECONDS = float(os.getenv("RAG_MODEL_RETRY_SECONDS", "60"))
+_model_error = None
+_prewarm_thread = None
+
+# Optional cross-encoder applied to fused search candidates, e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "")
+_reranker = None
+
+# On-disk embedding cache, keyed by sha256(model name + chunk text)
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(tempfile.gettempdir(), "rag_embed_cache.sqlite"))
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+
+_embed_cache_lock = threading.Lock()
+_embed_cache_conn = None
+
+# Process-wide cache of loaded indexes and chunk stores, shared by every Streamlit session
+INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+_index_cache = OrderedDict()
+_index_cache_bytes = 0
+_index_cache_lock = threading.Lock()
+
+# Index types for save_to_faiss: "flat", "ivf_flat", "ivf_pq", "hnsw" or "auto" (picked by vector count)
+INDEX_KIND = os.getenv("RAG_INDEX_KIND", "auto")
+NPROBE = int(os.getenv("RAG_NPROBE", "16"))
+EF_SEARCH = int(os.getenv("RAG_EF_SEARCH", "64"))
+HNSW_M = 32
+
+def get_model():
+    global _model, _model_error
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                if _model_error and time.monotonic() - _model_error[0] < MODEL_RETRY_SECONDS:
+                    raise _model_error[1]
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    kwargs = {}
+                    if MODEL_BACKEND != "torch":
+                        kwargs["backend"] = MODEL_BACKEND
+                    if MODEL_FILE:
+                        kwargs["model_kwargs"] = {"file_name": MODEL_FILE}
+                    _model = SentenceTransformer(MODEL_PATH or MODEL_NAME, **kwargs)
+                except Exception as e:
+                    _model_error = (time.monotonic(), e)
+                    raise
+    return _model
+
+def _prewarm():
+    try:
+        get_model().encode(["warm up"], show_progress_bar=False)
+    except Exception as e:
+        print("Model prewarm failed:", e)
+
+def prewarm_model():
+    # Loads the model in the background so the page can render while torch imports
+    global _prewarm_thread
+    if not MODEL_PREWARM or _model is not None:
+        return
+    with _model_lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(target=_prewarm, name="rag-model-prewarm", daemon=True)
+            _prewarm_thread.start()
+
+def get_reranker():
+    global _reranker
+    if _reranker is None and RERANK_MODEL:
+        with _model_lock:
+            if _reranker is None:
+                from sentence_transformers import CrossEncoder
+                _reranker = CrossEncoder(RERANK_MODEL)
+    return _reranker
+
+def rerank(query, texts):
+    # Cross-encoder relevance score per text, or None when no rerank model is configured
+    reranker = get_reranker()
+    if reranker is None or not texts:
+        return None
+    return [float(score) for score in reranker.predict([(query, text) for text in texts], show_progress_bar=False)]
+
+def __getattr__(name):
+    # Keeps `from rag import model` working without loading the model at import time
+    if name == "model":
+        return get_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _embed_cache():
+    global _embed_cache_conn
+    if _embed_cache_conn is None:
+        conn = sqlite3.connect(EMBED_CACHE_PATH, check_same_thread=False)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        conn.commit()
+        _embed_cache_conn = conn
+    return _embed_cache_conn
+
+def _embedding_key(chunk):
+    return hashlib.sha256(f"{MODEL_ID}\0{chunk}".encode("utf-8")).hexdigest()
+
+def _cache_lookup(conn, keys):
+    found = {}
+    for i in range(0, len(keys), 500):
+        batch = keys[i:i + 500]
+        placeholders = ",".join("?" * len(batch))
+        rows = conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch).fetchall()
+        for key, blob in rows:
+            found[key] = np.frombuffer(blob, dtype=np.float32)
+    return found
+
+def _cache_evict(conn):
+    (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+    excess = count - EMBED_CACHE_MAX_ENTRIES
+    if excess > 0:
+        conn.execute("""
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?
+            )
+        """, (excess,))
+
+@timed("embed_chunks")
+def embed_chunks(chunks):
+    if not chunks:
+        return get_model().encode(chunks, show_progress_bar=False)
+
+    keys = [_embedding_key(chunk) for chunk in chunks]
+    text_by_key = dict(zip(keys, chunks))
+    unique_keys = list(text_by_key)
+
+    try:
+        with _embed_cache_lock:
+            found = _cache_lookup(_embed_cache(), unique_keys)
+    except sqlite3.Error as e:
+        print("Embedding cache unavailable:", e)
+        return get_model().encode(chunks, show_progress_bar=False)
+
+    missing = [key for key in unique_keys if key not in found]
+    record_cache("embedding", True, len(unique_keys) - len(missing))
+    record_cache("embedding", False, len(missing))
+    missing_set = set(missing)
+    if missing:
+        vectors = get_model().encode([text_by_key[key] for key in missing], show_progress_bar=False)
+        for key, vector in zip(missing, np.asarray(vectors, dtype=np.float32)):
+            found[key] = vector
+
+    now = time.time()
+    try:
+        with _embed_cache_lock:
+            conn = _embed_cache()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, found[key].tobytes(), now) for key in missing]
+            )
+            conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, key) for key in unique_keys if key not in missing_set]
+            )
+            _cache_evict(conn)
+            conn.commit()
+    except sqlite3.Error as e:
+        print("Could not update embedding cache:", e)
+
+    return np.vstack([found[key] for key in keys])
+
+@timed("embed_query")
+def embed_query(query):
+    return np.asarray(get_model().encode([query]), dtype=np.float32)
+
+def embed_normalized(texts):
+    # Unit-length embeddings, so a dot product is the cosine similarity (intent and case-type prototypes)
+    vectors = np.asarray(get_model().encode(texts, show_progress_bar=False), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def index_key(file_bytes, chunk_tokens=None, overlap_tokens=None):
+    chunk_tokens = chunk_tokens or CHUNK_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    digest = hashlib.sha256(file_bytes)
+    digest.update(f"\0{MODEL_ID}\0tokens:{chunk_tokens}:{overlap_tokens}".encode("utf-8"))
+    return digest.hexdigest()
+
+def choose_index_kind(num_vectors):
+    if num_vectors < 10000:
+        return "flat"
+    if num_vectors < 200000:
+        return "hnsw"
+    if num_vectors < 2000000:
+        return "ivf_flat"
+    return "ivf_pq"
+
+def _pq_subquantizers(dim):
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dim % m == 0 and dim // m >= 4:
+            return m
+    return 1
+
+def train_index(embeddings, kind=None):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    num_vectors, dim = embeddings.shape
+    kind = kind or INDEX_KIND
+    if kind == "auto":
+        kind = choose_index_kind(num_vectors)
+
+    if kind in ("ivf_flat", "ivf_pq"):
+        # k-means needs ~39 training points per list; fall back to exact search when there are too few
+        nlist = min(int(4 * np.sqrt(num_vectors)), num_vectors // 39)
+        if nlist < 2:
+            return faiss.IndexFlatL2(dim)
+        quantizer = faiss.IndexFlatL2(dim)
+        if kind == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim), 8)
+        index.train(embeddings)
+        return index
+    if kind == "hnsw":
+        return faiss.IndexHNSWFlat(dim, HNSW_M)
+    if kind == "flat":
+        return faiss.IndexFlatL2(dim)
+    raise ValueError(f"Unknown index kind: {kind}")
+
+def make_index(embeddings, kind=None):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    index = train_index(embeddings, kind=kind)
+    index.add(embeddings)
+    return index
+
+def search_params(index, nprobe=None, ef_search=None, sel=None):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(nprobe=min(nprobe or NPROBE, ivf.nlist), sel=sel)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search or EF_SEARCH, sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+def save_to_faiss(chunks, embeddings, faiss_path, kind=None):
+    index = make_index(embeddings, kind=kind)
+    faiss.write_index(index, faiss_path + ".index")
+    with open(faiss_path + "_chunks.pkl", "wb") as f:
+        pickle.dump(chunks, f)
+    evict_index(faiss_path)
+
+def _index_signature(faiss_path):
+    signature = []
+    for suffix in (".index", "_chunks.pkl"):
+        stat = os.stat(faiss_path + suffix)
+        signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def evict_index(faiss_path):
+    global _index_cache_bytes
+    with _index_cache_lock:
+        entry = _index_cache.pop(faiss_path, None)
+        if entry:
+            _index_cache_bytes -= entry["size"]
+
+def load_index(faiss_path):
+    global _index_cache_bytes
+    signature = _index_signature(faiss_path)
+    with _index_cache_lock:
+        entry = _index_cache.get(faiss_path)
+        if entry and entry["signature"] == signature:
+            _index_cache.move_to_end(faiss_path)
+            return entry["index"], entry["chunks"]
+
+    index = faiss.read_index(faiss_path + ".index")
+    with open(faiss_path + "_chunks.pkl", "rb") as f:
+        chunks = pickle.load(f)
+
+    # On-disk size is a close enough proxy for the resident size of a flat index and its chunks
+    size = sum(file_size for _, file_size in signature)
+    with _index_cache_lock:
+        old = _index_cache.pop(faiss_path, None)
+        if old:
+            _index_cache_bytes -= old["size"]
+        if size <= INDEX_CACHE_MAX_BYTES:
+            _index_cache[faiss_path] = {"signature": signature, "index": index, "chunks": chunks, "size": size}
+            _index_cache_bytes += size
+            while _index_cache_bytes > INDEX_CACHE_MAX_BYTES:
+                _, evicted = _index_cache.popitem(last=False)
+                _index_cache_bytes -= evicted["size"]
+    return index, chunks
+
+@timed("search_faiss")
+def search_faiss(query, faiss_path, top_k=5, nprobe=None, ef_search=None):
+    index, chunks = load_index(faiss_path)
+
+    query_embedding = embed_query(query)
+    _, I = index.search(query_embedding, top_k, params=search_params(index, nprobe, ef_search))
+    return [chunks[i] for i in I[0] if i != -1]
+
@@ -0,0 +1,128 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from metrics import record_cache
+
+# Answers to general legal questions are shared across sessions; anything personal is never cached
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 3600)))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "500"))
+
+PERSONAL_PATTERNS = [
+    re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+"),
+    re.compile(r"(\+?\d[\d\s().-]{7,}\d)"),
+    re.compile(r"\bmy name(?:'s| is)\b", re.IGNORECASE),
+    re.compile(r"\b(?:i am|i'm|im|this is) [a-z]+ [a-z]+\b$", re.IGNORECASE),
+    re.compile(r"\b\d{1,5} [a-z]+ (?:st|street|ave|avenue|rd|road|blvd|lane|ln|dr|drive)\b", re.IGNORECASE),
+    re.compile(r"\b(?:ssn|social security|date of birth|dob|case number|policy number)\b", re.IGNORECASE)
+]
+
+
+def contains_personal_details(text):
+    return any(pattern.search(text) for pattern in PERSONAL_PATTERNS)
+
+
+def _embed(text):
+    from rag import embed_query
+    vector = embed_query(text)[0]
+    return vector / np.linalg.norm(vector)
+
+
+class SemanticCache:
+    def __init__(self, threshold=None, ttl=None, max_entries=None):
+        self.threshold = SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        self.ttl = SEMANTIC_CACHE_TTL if ttl is None else ttl
+        self.max_entries = max_entries or SEMANTIC_CACHE_MAX_ENTRIES
+        self.entries = OrderedDict()
+        self.next_id = 0
+        self.matrix = None
+        self.matrix_ids = []
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _expire(self, now):
+        expired = [entry_id for entry_id, entry in self.entries.items() if now - entry["created"] > self.ttl]
+        for entry_id in expired:
+            del self.entries[entry_id]
+        if expired:
+            self.matrix = None
+
+    def _vectors(self):
+        if self.matrix is None and self.entries:
+            self.matrix_ids = list(self.entries)
+            self.matrix = np.vstack([self.entries[entry_id]["vector"] for entry_id in self.matrix_ids])
+        return self.matrix
+
+    def lookup(self, question, vector=None):
+        # Returns (answer, similarity) or (None, best similarity)
+        if contains_personal_details(question):
+            return None, 0.0
+        if vector is None:
+            try:
+                vector = _embed(question)
+            except Exception as e:
+                print("Semantic cache unavailable:", e)
+                record_cache("semantic", False)
+                return None, 0.0
+        with self.lock:
+            self._expire(time.time())
+            matrix = self._vectors()
+            if matrix is None:
+                self.misses += 1
+                record_cache("semantic", False)
+                return None, 0.0
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                record_cache("semantic", False)
+                return None, similarity
+            entry_id = self.matrix_ids[best]
+            self.entries.move_to_end(entry_id)
+            self.hits += 1
+            record_cache("semantic", True)
+            return self.entries[entry_id]["answer"], similarity
+
+    def store(self, question, answer, vector=None):
+        if contains_personal_details(question) or contains_personal_details(answer):
+            return False
+        if vector is None:
+            try:
+                vector = _embed(question)
+            except Exception as e:
+                print("Semantic cache unavailable:", e)
+                return False
+        with self.lock:
+            self.entries[self.next_id] = {"question": question, "answer": answer, "vector": vector, "created": time.time()}
+            self.next_id += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.matrix = None
+        return True
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticCache()
+        return _cache
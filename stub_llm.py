@@ -0,0 +1,33 @@
+import threading
+import time
+from types import SimpleNamespace
+
+# Offline stand-in for OpenAI().chat.completions, used by the benchmarks and the batch CLI
+
+
+class StubChatClient:
+    def __init__(self, latency=0.0, reply=None):
+        self.latency = latency
+        self.reply = reply
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model=None, messages=None, temperature=None, timeout=None, **kwargs):
+        with self.lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        prompt = messages[-1]["content"]
+        content = self.reply or "Summary: " + " ".join(prompt.split()[-60:])
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
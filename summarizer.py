@@ -0,0 +1,135 @@
+import os
+import time
+import numpy as np
+from llm_pool import complete_many, estimate_tokens
+
+SUMMARY_TARGET_TOKENS = int(os.getenv("SUMMARY_TARGET_TOKENS", "900"))
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "6"))
+# Summary chunks go to the LLM, not the embedder, so they can be larger than search chunks
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "400"))
+# "extractive": pick representative chunks from their search embeddings, then at most one LLM call;
+# "map_reduce": one LLM call per chunk plus combine levels
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "extractive")
+SUMMARY_EXTRACT_CHUNKS = int(os.getenv("SUMMARY_EXTRACT_CHUNKS", "8"))
+SUMMARY_DIVERSITY = float(os.getenv("SUMMARY_DIVERSITY", "0.3"))
+
+
+def chunk_prompt(idx, chunk):
+    return f"""
+You are a helpful legal assistant. Summarize the following portion of a legal document in clear and concise language.
+Focus on key events, involved parties, dates, and outcomes if mentioned.
+
+Document Chunk {idx+1}:
+\"\"\"{chunk}\"\"\"
+"""
+
+
+def combine_prompt(summaries):
+    joined = "\n\n".join(f"Part {i+1}:\n{summary}" for i, summary in enumerate(summaries))
+    return f"""
+You are a helpful legal assistant. The following are summaries of consecutive parts of the same legal document.
+Combine them into a single concise summary that keeps the key events, involved parties, dates, and outcomes in order.
+Do not mention the parts or that you are combining summaries.
+
+\"\"\"{joined}\"\"\"
+"""
+
+
+def selected_prompt(chunks):
+    joined = "\n\n".join(f"Excerpt {i+1}:\n{chunk}" for i, chunk in enumerate(chunks))
+    return f"""
+You are a helpful legal assistant. The following excerpts were selected from a legal document as the most representative passages, in document order.
+Write a single concise summary of the document in clear language, covering key events, involved parties, dates, and outcomes if mentioned.
+Do not mention the excerpts.
+
+\"\"\"{joined}\"\"\"
+"""
+
+
+def select_representative(embeddings, k=None, diversity=None):
+    # Maximal marginal relevance against the document centroid: close to the whole, far from what's already picked.
+    # Returns chunk indices in document order
+    k = k or SUMMARY_EXTRACT_CHUNKS
+    diversity = SUMMARY_DIVERSITY if diversity is None else diversity
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if len(vectors) <= k:
+        return list(range(len(vectors)))
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    centroid = vectors.mean(axis=0)
+    relevance = vectors @ (centroid / max(np.linalg.norm(centroid), 1e-12))
+
+    selected = [int(np.argmax(relevance))]
+    closest = vectors @ vectors[selected[0]]
+    while len(selected) < k:
+        scores = (1 - diversity) * relevance - diversity * closest
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        closest = np.maximum(closest, vectors @ vectors[best])
+    return sorted(selected)
+
+
+def summarize_selected(client, chunks, model="gpt-4-0613"):
+    # One abstractive pass over the selected chunks; returns (summary, levels) like map_reduce_summarize
+    summaries, stats = _run_level(client, 0, [selected_prompt(chunks)], model)
+    stats["name"] = f"{len(chunks)} selected chunks"
+    return summaries[0], [stats]
+
+
+def _run_level(client, level, prompts, model):
+    started = time.perf_counter()
+    results = complete_many(client, prompts, model=model, temperature=0.3, timeout=60)
+    outputs, failed = [], 0
+    prompt_tokens, completion_tokens = 0, 0
+
+    for idx, (prompt, result) in enumerate(zip(prompts, results)):
+        if isinstance(result, Exception):
+            failed += 1
+            outputs.append(f"[Part {idx+1} could not be summarized: {result}]")
+            prompt_tokens += estimate_tokens(prompt)
+            continue
+        text = result.choices[0].message.content.strip()
+        outputs.append(text)
+        usage = getattr(result, "usage", None)
+        if usage is not None:
+            prompt_tokens += usage.prompt_tokens
+            completion_tokens += usage.completion_tokens
+        else:
+            prompt_tokens += estimate_tokens(prompt)
+            completion_tokens += estimate_tokens(text)
+
+    stats = {
+        "level": level,
+        "calls": len(prompts),
+        "failed": failed,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "seconds": round(time.perf_counter() - started, 2)
+    }
+    return outputs, stats
+
+
+def map_reduce_summarize(client, chunks, model="gpt-4-0613", target_tokens=None, batch_size=None):
+    target_tokens = target_tokens or SUMMARY_TARGET_TOKENS
+    batch_size = max(2, batch_size or SUMMARY_BATCH_SIZE)
+
+    summaries, stats = _run_level(client, 0, [chunk_prompt(idx, chunk) for idx, chunk in enumerate(chunks)], model)
+    levels = [stats]
+
+    while len(summaries) > 1 and estimate_tokens("\n\n".join(summaries)) > target_tokens:
+        batches = [summaries[i:i + batch_size] for i in range(0, len(summaries), batch_size)]
+        summaries, stats = _run_level(client, len(levels), [combine_prompt(batch) for batch in batches], model)
+        levels.append(stats)
+
+    return "\n\n".join(summaries), levels
+
+
+def format_level_stats(levels):
+    lines = []
+    for stats in levels:
+        name = stats.get("name") or ("Chunks" if stats["level"] == 0 else f"Level {stats['level']}")
+        line = f"{name}: {stats['calls']} calls, {stats['prompt_tokens']} prompt + {stats['completion_tokens']} completion tokens, {stats['seconds']}s"
+        if stats["failed"]:
+            line += f", {stats['failed']} failed"
+        lines.append(line)
+    return lines
@@ -0,0 +1,111 @@
+import os
+import sqlite3
+import time
+import pytest
+import case_store
+from case_store import CaseStore, COLUMNS
+
+
+def case(name):
+    return {"name": name, "contact": f"{name.lower()}@example.com", "case_type": "Tenant dispute",
+            "date_of_incident": "2024-03-01", "description": "Deposit was not returned."}
+
+
+def stored_names():
+    with sqlite3.connect(case_store.CASE_SQLITE_PATH) as conn:
+        return sorted(row[0] for row in conn.execute("SELECT name FROM intake_cases"))
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def make_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(case_store, "CASE_SQLITE_PATH", str(tmp_path / "cases.sqlite"))
+    monkeypatch.setattr(case_store, "CASE_FLUSH_INTERVAL", 0.2)
+    monkeypatch.setattr(case_store, "_backoff", lambda attempt: 0)
+
+    def make(**kwargs):
+        return CaseStore(backend="sqlite", spool_dir=str(tmp_path / "spool"), **kwargs)
+    return make
+
+
+def spool_files(store, suffix):
+    return [name for name in os.listdir(store.spool_dir) if name.endswith(suffix)]
+
+
+def test_sync_save_writes_the_case(make_store):
+    store = make_store(write_behind=False)
+    assert store.save(case("Ada")) == "saved"
+    assert stored_names() == ["Ada"]
+    assert store.pending() == 0
+
+
+def test_sync_save_spools_when_the_database_fails_and_replays_later(make_store, monkeypatch):
+    monkeypatch.setattr(case_store, "CASE_MAX_RETRIES", 1)
+    store = make_store(write_behind=False)
+    insert_many = store.insert_many
+
+    def unavailable(records):
+        raise sqlite3.OperationalError("database is locked")
+
+    store.insert_many = unavailable
+    assert store.save(case("Ada")) == "spooled"
+    assert store.pending() == 1 and stored_names() == []
+
+    store.insert_many = insert_many
+    store._replay_spool()
+    wait_for(lambda: store.pending() == 0)
+    assert stored_names() == ["Ada"]
+
+
+def test_write_behind_batches_queued_cases(make_store):
+    store = make_store(write_behind=True)
+    batches = []
+    insert_many = store.insert_many
+
+    def recording(records):
+        batches.append(len(records))
+        insert_many(records)
+
+    store.insert_many = recording
+    names = [f"Client{i}" for i in range(5)]
+    assert [store.save(case(name)) for name in names] == ["queued"] * 5
+    wait_for(lambda: store.pending() == 0)
+    assert stored_names() == sorted(names)
+    assert max(batches) > 1
+
+
+def test_flush_retries_outages(make_store):
+    store = make_store(write_behind=True)
+    paths = [store._spool(case(name)) for name in ("Ada", "Bob")]
+    failures = ["no such table: intake_cases", "database is locked"]
+    insert_many = store.insert_many
+
+    def flaky(records):
+        if failures:
+            raise sqlite3.OperationalError(failures.pop(0))
+        insert_many(records)
+
+    store.insert_many = flaky
+    store._flush(paths)
+    assert stored_names() == ["Ada", "Bob"]
+    assert store.pending() == 0 and spool_files(store, ".failed") == []
+
+
+def test_flush_parks_only_rows_the_database_rejects(make_store):
+    with sqlite3.connect(case_store.CASE_SQLITE_PATH) as conn:
+        conn.execute(f"CREATE TABLE intake_cases (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                     f"{', '.join(f'{column} TEXT NOT NULL' for column in COLUMNS)})")
+    store = make_store(write_behind=True)
+    bad = dict(case("Bob"), contact=None)
+    paths = [store._spool(case("Ada")), store._spool(bad), store._spool(case("Cy"))]
+
+    store._flush(paths)
+    assert stored_names() == ["Ada", "Cy"]
+    assert spool_files(store, ".json") == []
+    assert spool_files(store, ".failed") == [os.path.basename(paths[1])[:-len(".json")] + ".failed"]
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import corpus
+from corpus import Corpus
+
+DIM = 16
+
+
+def add(store, doc_id, vectors):
+    records = [{"page": 1, "offset": i, "text": f"{doc_id} chunk {i}"} for i in range(len(vectors))]
+    store.add_document(doc_id, doc_id, records, vectors)
+
+
+def exact_top(store, doc_id, query, k):
+    ids = [record["id"] for record in store.document_chunks(doc_id)]
+    vectors = store.index.reconstruct_batch(np.asarray(ids, dtype=np.int64))
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    return [ids[i] for i in np.argsort(distances)[:k]]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    query = np.random.default_rng(1).random((1, DIM), dtype=np.float32)
+    monkeypatch.setattr(corpus, "embed_query", lambda text: query)
+    store = Corpus(directory=str(tmp_path))
+    store.query = query
+    return store
+
+
+def test_filtered_search_is_exact_after_switch_to_ivf(store):
+    rng = np.random.default_rng(0)
+    add(store, "big", rng.random((12000, DIM), dtype=np.float32))
+    add(store, "small", rng.random((20, DIM), dtype=np.float32))
+    assert store._index_kind() == "ivf_flat"
+
+    results = store.search("q", doc_ids=["small"], top_k=5, hybrid=False)
+    assert [r["id"] for r in results] == exact_top(store, "small", store.query, 5)
+    assert {r["doc_id"] for r in results} == {"small"}
+
+
+def test_index_shrinks_back_to_flat_and_keeps_vectors(store):
+    rng = np.random.default_rng(0)
+    small = rng.random((20, DIM), dtype=np.float32)
+    add(store, "big", rng.random((12000, DIM), dtype=np.float32))
+    add(store, "small", small)
+    store.delete_document("big")
+
+    assert store._index_kind() == "flat"
+    assert store.index.ntotal == 20
+    ids = np.asarray([record["id"] for record in store.document_chunks("small")], dtype=np.int64)
+    assert np.allclose(store.index.reconstruct_batch(ids), small)
+    results = store.search("q", doc_ids=["small"], top_k=5, hybrid=False)
+    assert [r["id"] for r in results] == exact_top(store, "small", store.query, 5)
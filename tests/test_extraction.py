@@ -0,0 +1,49 @@
+from extraction import iter_chunk_records, token_spans, count_tokens
+
+
+def sentence_paragraph(min_tokens):
+    sentences, i = [], 0
+    while count_tokens(" ".join(sentences)) < min_tokens:
+        sentences.append(f"Clause {i} requires the tenant to notify the landlord in writing within ten days.")
+        i += 1
+    return " ".join(sentences)
+
+
+def assert_covered(text, records):
+    ranges = [(record["offset"], record["end"]) for record in records]
+    for start, end in token_spans(text):
+        assert any(lo <= start and end <= hi for lo, hi in ranges), text[start:end]
+
+
+def test_long_paragraph_is_fully_covered():
+    text = sentence_paragraph(600)
+    assert count_tokens(text) >= 600
+    records = list(iter_chunk_records([text], chunk_tokens=200, overlap_tokens=30))
+    assert len(records) >= 3
+    assert all(0 < record["tokens"] <= 200 for record in records)
+    assert_covered(text, records)
+
+
+def test_sentence_longer_than_budget_is_hard_split():
+    text = " ".join(f"word{i}" for i in range(600))
+    records = list(iter_chunk_records([text], chunk_tokens=100, overlap_tokens=0))
+    assert all(record["tokens"] <= 100 for record in records)
+    assert_covered(text, records)
+
+
+def test_offsets_and_pages_point_into_the_document():
+    pages = ["Short opening line.\n" + sentence_paragraph(300) + "\n", "Second page text here.\n"]
+    document = "".join(pages)
+    records = list(iter_chunk_records(pages, chunk_tokens=120, overlap_tokens=20))
+    assert records[0]["text"].startswith("Short opening line.")
+    assert records[-1]["end"] > len(pages[0])
+    for record in records:
+        assert record["page"] == (1 if record["offset"] < len(pages[0]) else 2)
+        assert document[record["offset"]:record["end"]].split()[0] == record["text"].split()[0]
+
+
+def test_no_empty_chunks():
+    assert list(iter_chunk_records([""])) == []
+    assert list(iter_chunk_records(["\n\n", "\n"])) == []
+    first = list(iter_chunk_records([sentence_paragraph(400) + "\nTail."], chunk_tokens=150))
+    assert all(record["text"] for record in first)
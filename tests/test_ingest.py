@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+import ingest
+from corpus import Corpus
+from extraction import TXT_MIME
+
+PARAGRAPH = "The tenant shall notify the landlord in writing within ten days of any damage to the premises. "
+
+
+def fake_embed(texts):
+    return np.asarray([[len(text), text.count(" "), 1.0, 0.0] for text in texts], dtype=np.float32)
+
+
+def txt_file(name, paragraphs):
+    data = "\n\n".join(f"{i}. {PARAGRAPH * 3}" for i in range(paragraphs)).encode("utf-8")
+    return {"name": name, "type": TXT_MIME, "bytes": data, "doc_id": name}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    events = []
+
+    def embed(texts):
+        events.append("embed")
+        return fake_embed(texts)
+
+    monkeypatch.setattr(ingest, "embed_chunks", embed)
+    monkeypatch.setattr(ingest, "INGEST_EMBED_BATCH", 8)
+    monkeypatch.setattr(ingest, "_get_pool", lambda: ThreadPoolExecutor(max_workers=2))
+    store = Corpus(directory=str(tmp_path))
+    store.events = events
+    return store
+
+
+def test_large_file_is_embedded_while_it_is_extracted(store, monkeypatch):
+    def pages(file_bytes, file_type):
+        for page in file_bytes.decode("utf-8").split("\n\n"):
+            store.events.append("page")
+            yield page + "\n\n"
+
+    monkeypatch.setattr(ingest, "iter_pages", pages)
+    item = txt_file("lease", 60)
+    results = ingest.ingest_files([item], corpus=store)
+
+    assert results["lease"] == len(store.document_chunks("lease")) > 8
+    # The first batch went to the embedder long before the last page was read
+    assert store.events.index("embed") < len(store.events) - 1 - store.events[::-1].index("page")
+    assert store.documents()[0]["num_chunks"] == results["lease"]
+
+
+def test_pooled_and_streamed_files_are_indexed(store, monkeypatch):
+    monkeypatch.setattr(ingest, "INGEST_STREAM_BYTES", 5000)
+    files = [txt_file("big", 40), txt_file("small", 2), txt_file("empty", 0)]
+    files[2]["bytes"] = b""
+    results = ingest.ingest_files(files, corpus=store)
+
+    assert results["big"] == len(store.document_chunks("big"))
+    assert results["small"] == len(store.document_chunks("small")) > 0
+    assert results["empty"] == 0
+    assert {doc["doc_id"] for doc in store.documents()} == {"big", "small"}
+    assert store.index.ntotal == results["big"] + results["small"]
+
+
+def test_failed_file_leaves_no_chunks_behind(store, monkeypatch):
+    real_pages = ingest.iter_pages
+
+    def pages(file_bytes, file_type):
+        yield from real_pages(file_bytes, file_type)
+        if file_bytes.startswith(b"0. broken"):
+            raise ValueError("corrupt page")
+
+    monkeypatch.setattr(ingest, "iter_pages", pages)
+    monkeypatch.setattr(ingest, "INGEST_STREAM_BYTES", 0)
+    broken = txt_file("broken", 30)
+    broken["bytes"] = b"0. broken " + broken["bytes"]
+    results = ingest.ingest_files([broken, txt_file("good", 5)], corpus=store)
+
+    assert isinstance(results["broken"], ValueError)
+    assert store.document_chunks("broken") == []
+    assert results["good"] == len(store.document_chunks("good"))
+    assert store.index.ntotal == results["good"]
+
+
+def test_unfinished_document_is_dropped_on_reopen(store, tmp_path):
+    records = [{"page": 1, "offset": 0, "text": "partial"}]
+    store.add_chunks("crashed", records, fake_embed(["partial"]))
+    store._save_index()
+
+    reopened = Corpus(directory=str(tmp_path))
+    assert reopened.document_chunks("crashed") == []
+    assert reopened.index.ntotal == 0
@@ -0,0 +1,76 @@
+import time
+import pytest
+from openai import APITimeoutError
+import llm_pool
+from llm_pool import RateLimiter, complete, complete_many
+from stub_llm import StubChatClient
+
+
+class FlakyClient(StubChatClient):
+    # Times out on the first `failures` calls, and always fails prompts that start with "broken"
+    def __init__(self, failures=0, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+
+    def create(self, model=None, messages=None, **kwargs):
+        with self.lock:
+            failing = self.failures > 0
+            self.failures -= failing
+        if failing:
+            raise APITimeoutError(request=None)
+        if messages[-1]["content"].startswith("broken"):
+            raise ValueError("bad request")
+        return super().create(model=model, messages=messages, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(llm_pool, "_retry_after", lambda error, attempt: 0)
+
+
+def limiter():
+    return RateLimiter(rpm=1000, tpm=10 ** 9)
+
+
+def test_complete_retries_transient_errors():
+    client = FlakyClient(failures=2)
+    response = complete(client, "summarize the lease", limiter=limiter(), max_retries=3)
+    assert response.choices[0].message.content == "Summary: summarize the lease"
+    assert client.calls == 1
+
+
+def test_complete_gives_up_after_max_retries():
+    with pytest.raises(APITimeoutError):
+        complete(FlakyClient(failures=5), "summarize the lease", limiter=limiter(), max_retries=2)
+
+
+def test_complete_many_keeps_prompt_order_and_returns_errors_in_place():
+    prompts = [f"part {i}" for i in range(12)]
+    prompts[5] = "broken part"
+    results = complete_many(FlakyClient(latency=0.01), prompts, max_workers=4)
+
+    assert isinstance(results[5], ValueError)
+    for prompt, result in zip(prompts, results):
+        if prompt != "broken part":
+            assert result.choices[0].message.content == f"Summary: {prompt}"
+
+
+def test_rate_limiter_waits_for_the_request_window():
+    rate = RateLimiter(rpm=2, tpm=10 ** 9, window=0.3)
+    started = time.monotonic()
+    for _ in range(3):
+        rate.acquire(10)
+    assert time.monotonic() - started >= 0.25
+
+
+def test_rate_limiter_counts_settled_tokens():
+    rate = RateLimiter(rpm=100, tpm=1000, window=0.3)
+    call = rate.acquire(900)
+    rate.settle(call, 100)
+    started = time.monotonic()
+    rate.acquire(800)
+    assert time.monotonic() - started < 0.1
+
+    started = time.monotonic()
+    rate.acquire(500)
+    assert time.monotonic() - started >= 0.25
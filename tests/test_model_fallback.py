@@ -0,0 +1,37 @@
+import os
+
+# chatbot_engine (imported by case_extractor) builds an OpenAI client at import; no request is made here
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import pytest
+import rag
+import intent_router
+import case_extractor
+from semantic_cache import SemanticCache
+
+
+@pytest.fixture(autouse=True)
+def broken_model(monkeypatch):
+    def get_model():
+        raise OSError("model files not found")
+
+    monkeypatch.setattr(rag, "get_model", get_model)
+    monkeypatch.setattr(rag, "embed_query", lambda text: get_model())
+    monkeypatch.setattr(intent_router, "_prototype_matrix", None)
+    monkeypatch.setattr(case_extractor, "_label_matrix", None)
+
+
+def test_router_sends_the_turn_to_the_llm():
+    assert intent_router.route_intent("my neighbour's dog bit me") == ("other", 0.0, None)
+    assert intent_router.route_intent("can i sue my landlord")[:2] == ("legal_question", 1.0)
+
+
+def test_semantic_cache_misses():
+    cache = SemanticCache()
+    assert cache.store("what is the statute of limitations", "Usually two years.") is False
+    assert cache.lookup("what is the statute of limitations") == (None, 0.0)
+
+
+def test_no_case_type_is_extracted():
+    assert case_extractor.extract_case_type("my landlord refuses to return my deposit", awaiting=True) is None
+    assert "Case Type" not in case_extractor.extract_case_fields("I slipped and fell at the grocery store")
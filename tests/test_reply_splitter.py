@@ -0,0 +1,54 @@
+import os
+
+# chatbot_engine builds an OpenAI client at import; no request is made here
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import pytest
+from chatbot_engine import ReplyJsonSplitter
+
+CASE_JSON = '{\n  "Full Name": "Jane Doe",\n  "Case Type": "Tenant {deposit} dispute"\n}'
+
+
+def split(text, step):
+    splitter = ReplyJsonSplitter()
+    shown = "".join(splitter.feed(text[i:i + step]) for i in range(0, len(text), step))
+    shown += splitter.finish()
+    assert shown == splitter.visible
+    return splitter.visible, splitter.json_text
+
+
+@pytest.mark.parametrize("step", [1, 3, 1000])
+def test_fenced_json_is_removed_from_reply(step):
+    text = f"I'm sorry to hear that. When did it happen?\n```json\n{CASE_JSON}\n```\n"
+    visible, json_text = split(text, step)
+    assert visible == "I'm sorry to hear that. When did it happen?\n\n"
+    assert json_text == CASE_JSON
+
+
+@pytest.mark.parametrize("step", [1, 4, 1000])
+def test_bare_json_is_removed_from_reply(step):
+    visible, json_text = split(f"Thanks, noted. {CASE_JSON} Anything else?", step)
+    assert visible == "Thanks, noted.  Anything else?"
+    assert json_text == CASE_JSON
+
+
+@pytest.mark.parametrize("step", [1, 2, 1000])
+def test_braces_in_prose_are_kept(step):
+    text = "Use the format {name} in your letter, or { } if unsure."
+    visible, json_text = split(text, step)
+    assert visible == text
+    assert json_text is None
+
+
+@pytest.mark.parametrize("step", [1, 5, 1000])
+def test_code_fences_without_json_are_kept(step):
+    text = "Write it like this:\n```\nDear {landlord},\n```\nand keep a copy."
+    visible, json_text = split(text, step)
+    assert visible == text
+    assert json_text is None
+
+
+def test_unclosed_object_is_shown_as_text():
+    visible, json_text = split('Here is what I have: {"Full Name": "Jane', 2)
+    assert visible == 'Here is what I have: {"Full Name": "Jane'
+    assert json_text is None